@@ -0,0 +1,111 @@
+import json
+import os
+
+import numpy as np
+
+
+class IVFIndex:
+    def __init__(self, centroids, order, offsets, vectors=None, codes=None, scales=None, fingerprint=""):
+        """
+        Inverted-file (IVF) index over L2-normalised embeddings, for cosine search.
+        - Rows are clustered around `centroids`; a query only scores the rows in its
+          `nprobe` closest clusters, so cost grows with cluster size, not gallery size.
+        - `order`/`offsets` hold the inverted lists: rows order[offsets[i]:offsets[i + 1]]
+          belong to cluster i.
+        - With int8 `codes` (one float32 `scale` per row) the index keeps 1 byte per dimension
+          instead of 4; otherwise it scores the float `vectors` directly (which may be a memmap).
+        """
+        self.centroids = centroids
+        self.order = order
+        self.offsets = offsets
+        self.vectors = vectors
+        self.codes = codes
+        self.scales = scales
+        self.fingerprint = fingerprint
+
+    @classmethod
+    def build(cls, vectors, n_lists=None, iterations=10, sample_size=50000, quantize=False,
+              fingerprint="", seed=0):
+        """Train the clusters with spherical k-means on a sample, then assign every row."""
+        count = len(vectors)
+        n_lists = n_lists or max(1, int(np.sqrt(count)))
+        rng = np.random.default_rng(seed)
+
+        sample = vectors
+        if count > sample_size:
+            sample = vectors[np.sort(rng.choice(count, sample_size, replace=False))]
+        sample = np.asarray(sample, dtype=np.float32)
+
+        centroids = sample[rng.choice(len(sample), min(n_lists, len(sample)), replace=False)].copy()
+        for _ in range(iterations):
+            assignment = np.argmax(sample @ centroids.T, axis=1)
+            for i in range(len(centroids)):
+                members = sample[assignment == i]
+                if len(members):
+                    centroid = members.sum(axis=0)
+                    norm = np.linalg.norm(centroid)
+                    centroids[i] = centroid / norm if norm > 0 else centroids[i]
+
+        assignment = np.empty(count, dtype=np.int32)
+        for start in range(0, count, 10000):
+            chunk = np.asarray(vectors[start:start + 10000], dtype=np.float32)
+            assignment[start:start + len(chunk)] = np.argmax(chunk @ centroids.T, axis=1)
+        order = np.argsort(assignment, kind="stable").astype(np.int64)
+        offsets = np.searchsorted(assignment[order], np.arange(len(centroids) + 1)).astype(np.int64)
+
+        if quantize:
+            codes, scales = quantize_int8(vectors)
+            return cls(centroids, order, offsets, codes=codes, scales=scales, fingerprint=fingerprint)
+        return cls(centroids, order, offsets, vectors=vectors, fingerprint=fingerprint)
+
+    def search(self, query, nprobe=8):
+        """
+        Best match for one normalised query among the probed clusters.
+        Returns (row, similarity), or (None, None) if the probed clusters are empty.
+        """
+        nprobe = min(nprobe, len(self.centroids))
+        probes = np.argpartition(-(self.centroids @ query), nprobe - 1)[:nprobe]
+        candidates = np.concatenate([self.order[self.offsets[i]:self.offsets[i + 1]] for i in probes])
+        if len(candidates) == 0:
+            return None, None
+        candidates.sort()  # Sequential reads when the vectors are memory-mapped
+
+        if self.codes is not None:
+            similarities = (self.codes[candidates].astype(np.float32) @ query) * self.scales[candidates]
+        else:
+            similarities = self.vectors[candidates] @ query
+        best = int(np.argmax(similarities))
+        return int(candidates[best]), float(similarities[best])
+
+    def save(self, path):
+        arrays = {"centroids": self.centroids, "order": self.order, "offsets": self.offsets}
+        if self.codes is not None:
+            arrays.update(codes=self.codes, scales=self.scales)
+        meta = json.dumps({"fingerprint": self.fingerprint})
+        tmp_path = path + ".tmp.npz"
+        np.savez(tmp_path, meta=np.array(meta), **arrays)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path, vectors=None):
+        """Load a saved index; float indexes score against `vectors` (the gallery matrix)."""
+        with np.load(path) as data:
+            meta = json.loads(str(data["meta"]))
+            codes = data["codes"] if "codes" in data else None
+            scales = data["scales"] if "scales" in data else None
+            return cls(data["centroids"], data["order"], data["offsets"],
+                       vectors=None if codes is not None else vectors,
+                       codes=codes, scales=scales, fingerprint=meta["fingerprint"])
+
+
+def quantize_int8(vectors, chunk_size=10000):
+    """Symmetric per-row int8 quantization: row ~= codes * scale."""
+    codes = np.empty(vectors.shape, dtype=np.int8)
+    scales = np.empty(len(vectors), dtype=np.float32)
+    for start in range(0, len(vectors), chunk_size):
+        chunk = np.asarray(vectors[start:start + chunk_size], dtype=np.float32)
+        scale = np.abs(chunk).max(axis=1) / 127.0
+        scale[scale == 0] = 1.0
+        codes[start:start + len(chunk)] = np.round(chunk / scale[:, np.newaxis]).astype(np.int8)
+        scales[start:start + len(chunk)] = scale
+    return codes, scales
@@ -0,0 +1,244 @@
+"""
+Asyncio HTTP server for high-concurrency MJPEG streaming.
+
+The /video_feedN routes are served from the shared camera broadcasters on one event loop,
+so hundreds of viewers cost a socket each rather than a thread each. Every other request
+(login, pages, /metrics) is passed to the Flask app through WSGI on a small thread pool.
+
+    STREAM_SERVER=async python main.py
+"""
+import asyncio
+import io
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs, unquote, urlsplit
+
+from camera_registry import CameraBusy
+from frame_encoder import DEFAULT_PROFILE, PROFILES
+
+BOUNDARY_HEADERS = (b"HTTP/1.1 200 OK\r\n"
+                    b"Content-Type: multipart/x-mixed-replace; boundary=frame\r\n"
+                    b"Cache-Control: no-cache\r\n"
+                    b"Connection: close\r\n\r\n")
+
+# A client whose socket has this much unsent data skips frames until it catches up
+MAX_PENDING_BYTES = 512 * 1024
+
+MAX_HEADER_BYTES = 64 * 1024
+
+
+class AsyncFanout:
+    def __init__(self, broadcaster, loop):
+        """
+        Bridges one broadcaster's pipeline thread to the event loop.
+        - A single listener per camera wakes every waiting client at once, however many there are.
+        """
+        self.broadcaster = broadcaster
+        self.loop = loop
+        self.event = asyncio.Event()
+        broadcaster.add_listener(self._notify)
+
+    def _notify(self):
+        self.loop.call_soon_threadsafe(self._wake)
+
+    def _wake(self):
+        event, self.event = self.event, asyncio.Event()
+        event.set()
+
+    async def next_frame(self, last_sequence):
+        """Wait for a frame newer than last_sequence; returns (None, sequence) once the pipeline stops."""
+        while True:
+            event = self.event
+            frame, sequence = self.broadcaster.latest()
+            if sequence != last_sequence and frame is not None:
+                return frame, sequence
+            if not self.broadcaster.running:
+                return None, sequence
+            await event.wait()
+
+    def close(self):
+        self.broadcaster.remove_listener(self._notify)
+
+
+class AsyncStreamServer:
+    def __init__(self, app, registry, routes, wsgi_threads=16):
+        """
+        `routes` maps a request path to the id of a camera in `registry`.
+        """
+        self.app = app
+        self.registry = registry
+        self.routes = routes
+        self.wsgi_pool = ThreadPoolExecutor(max_workers=wsgi_threads, thread_name_prefix="wsgi")
+        self.encode_pool = ThreadPoolExecutor(max_workers=4, thread_name_prefix="mjpeg-encode")
+        self.fanouts = {}
+
+    async def handle(self, reader, writer):
+        try:
+            request = await self._read_request(reader)
+            if request is None:
+                return
+            method, target, headers, body = request
+            path = urlsplit(target).path
+            if method == "GET" and path in self.routes:
+                await self._stream(target, writer)
+            else:
+                await self._wsgi(method, target, headers, body, reader, writer)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        except Exception as e:
+            print(f"Error handling request: {e}")
+        finally:
+            writer.close()
+
+    async def _read_request(self, reader):
+        try:
+            head = await reader.readuntil(b"\r\n\r\n")
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError):
+            return None
+        if len(head) > MAX_HEADER_BYTES:
+            return None
+        lines = head.decode("latin-1").split("\r\n")
+        method, target, _ = lines[0].split(" ", 2)
+        headers = {}
+        for line in lines[1:]:
+            if ":" in line:
+                name, value = line.split(":", 1)
+                headers[name.strip().lower()] = value.strip()
+        length = int(headers.get("content-length", 0) or 0)
+        body = await reader.readexactly(length) if length else b""
+        return method, target, headers, body
+
+    def _fanout(self, broadcaster):
+        fanout = self.fanouts.get(broadcaster.source)
+        if fanout is None or fanout.broadcaster is not broadcaster:
+            if fanout is not None:
+                fanout.close()
+            fanout = AsyncFanout(broadcaster, asyncio.get_running_loop())
+            self.fanouts[broadcaster.source] = fanout
+        return fanout
+
+    async def _stream(self, target, writer):
+        profile = parse_qs(urlsplit(target).query).get("profile", [DEFAULT_PROFILE])[-1]
+        if profile not in PROFILES:
+            writer.write(b"HTTP/1.1 400 Bad Request\r\nConnection: close\r\n\r\nUnknown profile")
+            return
+
+        camera_id = self.routes[urlsplit(target).path]
+        loop = asyncio.get_running_loop()
+        try:
+            # Starting a camera can block, so it happens off the event loop
+            broadcaster = await loop.run_in_executor(self.wsgi_pool, self.registry.open, camera_id)
+        except Exception as e:
+            status = b"503 Service Unavailable" if isinstance(e, CameraBusy) else b"500 Internal Server Error"
+            message = f"Error: {e}".encode()
+            writer.write(b"HTTP/1.1 " + status + b"\r\nConnection: close\r\n"
+                         b"Content-Length: " + str(len(message)).encode() + b"\r\n\r\n" + message)
+            return
+
+        # open() attached this viewer, so its slot is released however the stream ends
+        try:
+            fanout = self._fanout(broadcaster)
+            writer.write(BOUNDARY_HEADERS)
+            sequence = 0
+            while not writer.is_closing():
+                frame, sequence = await fanout.next_frame(sequence)
+                if frame is None:
+                    break
+                if writer.transport.get_write_buffer_size() > MAX_PENDING_BYTES:
+                    continue  # Slow client: drop this frame rather than queue it
+                chunk = frame.chunks.get(profile)
+                if chunk is None:
+                    chunk = await loop.run_in_executor(self.encode_pool, frame.chunk, profile)
+                writer.write(chunk)
+        finally:
+            broadcaster.detach()
+
+    async def _wsgi(self, method, target, headers, body, reader, writer):
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(self.wsgi_pool, self._call_app, method, target, headers, body, writer, loop)
+
+    @staticmethod
+    async def _send(writer, data):
+        writer.write(data)
+        await writer.drain()
+
+    def _call_app(self, method, target, headers, body, writer, loop):
+        """
+        Run the WSGI app on a worker thread and write its response as it is produced.
+        - Each chunk waits for the client to drain the previous one, so streamed responses
+          (exports, clips) never sit in memory whole.
+        """
+        parts = urlsplit(target)
+        peer = writer.get_extra_info("peername") or ("", 0)
+        sock = writer.get_extra_info("sockname") or ("", 0)
+        environ = {
+            "REQUEST_METHOD": method,
+            "SCRIPT_NAME": "",
+            "PATH_INFO": unquote(parts.path),
+            "QUERY_STRING": parts.query,
+            "SERVER_NAME": str(sock[0]),
+            "SERVER_PORT": str(sock[1]),
+            "SERVER_PROTOCOL": "HTTP/1.1",
+            "REMOTE_ADDR": str(peer[0]),
+            "CONTENT_TYPE": headers.get("content-type", ""),
+            "CONTENT_LENGTH": str(len(body)),
+            "wsgi.version": (1, 0),
+            "wsgi.url_scheme": "http",
+            "wsgi.input": io.BytesIO(body),
+            "wsgi.errors": sys.stderr,
+            "wsgi.multithread": True,
+            "wsgi.multiprocess": False,
+            "wsgi.run_once": False,
+        }
+        for name, value in headers.items():
+            key = "HTTP_" + name.upper().replace("-", "_")
+            if key not in ("HTTP_CONTENT_TYPE", "HTTP_CONTENT_LENGTH"):
+                environ[key] = value
+
+        response = {}
+
+        def start_response(status, response_headers, exc_info=None):
+            response["status"] = status
+            response["headers"] = response_headers
+
+        def send(data):
+            asyncio.run_coroutine_threadsafe(self._send(writer, data), loop).result()
+
+        def head():
+            lines = [f"HTTP/1.1 {response['status']}"] + [
+                f"{name}: {value}" for name, value in response["headers"]
+                if name.lower() not in ("connection", "transfer-encoding")]
+            lines.append("Connection: close")
+            return ("\r\n".join(lines) + "\r\n\r\n").encode("latin-1")
+
+        result = self.app(environ, start_response)
+        try:
+            # start_response may be deferred until the first chunk, so the head goes out with it
+            head_sent = False
+            for chunk in result:
+                if not chunk:
+                    continue
+                if not head_sent:
+                    send(head())
+                    head_sent = True
+                send(chunk)
+            if not head_sent:
+                send(head())
+        finally:
+            if hasattr(result, "close"):
+                result.close()
+
+
+async def _serve(server, host, port):
+    listener = await asyncio.start_server(server.handle, host, port, limit=MAX_HEADER_BYTES, backlog=1024)
+    print(f"Async stream server listening on http://{host}:{port}")
+    async with listener:
+        await listener.serve_forever()
+
+
+def serve(app, registry, routes, host="127.0.0.1", port=5000):
+    """Serve `app` with the camera routes multiplexed on an event loop (blocks until interrupted)."""
+    try:
+        asyncio.run(_serve(AsyncStreamServer(app, registry, routes), host, port))
+    except KeyboardInterrupt:
+        pass
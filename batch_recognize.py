@@ -0,0 +1,282 @@
+"""
+Offline face recognition over recorded footage and image folders.
+
+Video files are split into segments and image folders into chunks, and the pieces are
+decoded, detected and recognized in parallel worker processes, as fast as the machine
+allows. Each piece's faces are stored with one bulk write through FaceDatabaseHandler,
+and finished pieces are appended to a checkpoint file, so an interrupted run picks up
+where it stopped when started again with the same checkpoint.
+
+Like the live cameras, only faces that match the gallery are stored; --store-unknown also
+stores the unmatched ones, labelled "Unknown".
+
+    python batch_recognize.py /footage/lobby-2024-05-01.mp4 /footage/stills --workers 8
+    python batch_recognize.py /footage/*.mp4 --sample-every 10 --checkpoint lobby.checkpoint
+"""
+import argparse
+import multiprocessing
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+
+import cv2
+
+from embedding_store import IMAGE_EXTENSIONS
+from face_gallery import DEFAULT_DB_PATH
+
+VIDEO_EXTENSIONS = (".mp4", ".avi", ".mkv", ".mov", ".m4v", ".mpg", ".mpeg", ".ts")
+
+_worker = None
+_worker_error = None
+
+
+def find_units(inputs, segment_frames, images_per_unit):
+    """
+    Split the inputs into independent units of work.
+    - A video becomes ("video", path, first_frame, frame_count) segments.
+    - The images under a folder become ("images", folder, paths) chunks.
+    """
+    units = []
+    for path in inputs:
+        if os.path.isdir(path):
+            images = []
+            for root, _, names in os.walk(path):
+                images.extend(os.path.join(root, name) for name in sorted(names)
+                              if name.lower().endswith(IMAGE_EXTENSIONS))
+            images.sort()
+            for start in range(0, len(images), images_per_unit):
+                units.append(("images", path, images[start:start + images_per_unit]))
+        elif path.lower().endswith(VIDEO_EXTENSIONS):
+            capture = cv2.VideoCapture(path)
+            total = int(capture.get(cv2.CAP_PROP_FRAME_COUNT))
+            capture.release()
+            if total <= 0:
+                print(f"Skipping {path}: could not read its frame count.", file=sys.stderr)
+                continue
+            for start in range(0, total, segment_frames):
+                units.append(("video", path, start, min(segment_frames, total - start)))
+        else:
+            print(f"Skipping {path}: not a video file or image folder.", file=sys.stderr)
+    return units
+
+
+def unit_key(unit):
+    """Stable identifier for a unit, as stored in the checkpoint file."""
+    if unit[0] == "video":
+        return f"video:{os.path.abspath(unit[1])}:{unit[2]}:{unit[3]}"
+    return f"images:{os.path.abspath(unit[2][0])}:{len(unit[2])}"
+
+
+def load_checkpoint(path):
+    if not path or not os.path.exists(path):
+        return set()
+    with open(path) as f:
+        return {line.strip() for line in f if line.strip()}
+
+
+class BatchWorker:
+    def __init__(self, db_path, detect_width, min_face_size, sample_every, store_unknown=False):
+        """
+        Per-process recognizer: its own models and gallery view, detection on a frame scaled
+        to `detect_width` and recognition on full-resolution crops, like the live cameras.
+        - The gallery's store is opened read-only; the parent process syncs it before the pool starts.
+        - Faces that match nobody are only recorded with `store_unknown`.
+        """
+        from face_gallery import get_gallery
+        from inference_service import InferenceService
+        from model_registry import models
+
+        models.warm_up()
+        self.gallery = get_gallery(db_path, sync=False)
+        # One detection thread: the parallelism comes from the worker processes
+        self.inference = InferenceService(self.gallery, detect_workers=1)
+        self.detect_width = detect_width
+        self.min_face_size = min_face_size
+        self.sample_every = sample_every
+        self.store_unknown = store_unknown
+
+    def keep(self, name):
+        """Whether a recognition result is stored."""
+        return name != "Unknown" or self.store_unknown
+
+    def detect(self, frame):
+        """Detect the faces in one frame; returns [(box, crop)] in full-resolution coordinates."""
+        scale = max(1.0, frame.shape[1] / float(self.detect_width))
+        small = frame
+        if scale > 1:
+            small = cv2.resize(frame, (self.detect_width, int(round(frame.shape[0] / scale))),
+                               interpolation=cv2.INTER_AREA)
+
+        faces = []
+        for box in self.inference.detect_boxes(small):
+            x, y, w, h = (int(round(v * scale)) for v in box)
+            if min(w, h) < self.min_face_size:
+                continue
+            crop = frame[max(0, y):y + h, max(0, x):x + w]
+            if crop.size > 0:
+                faces.append(((x, y, w, h), crop))
+        return faces
+
+    def recognize(self, crops):
+        """Recognize several crops in one batch; returns [(name, distance)]."""
+        if not crops:
+            return []
+        return [(os.path.basename(identity) if identity is not None else "Unknown", distance)
+                for identity, distance in self.gallery.identify_batch(crops)]
+
+    def run_video(self, path, start, count):
+        """
+        Recognize one segment of a video.
+        - Only every `sample_every`-th frame is decoded; the others are just grabbed.
+        - Faces are tracked across sampled frames and stored once per new or re-verified track.
+        - Timestamps assume the file's mtime is when the recording ended.
+        """
+        from face_tracker import FaceTracker
+
+        capture = cv2.VideoCapture(path)
+        fps = capture.get(cv2.CAP_PROP_FPS) or 25.0
+        total = int(capture.get(cv2.CAP_PROP_FRAME_COUNT))
+        started_at = datetime.fromtimestamp(os.path.getmtime(path)) - timedelta(seconds=total / fps)
+        capture.set(cv2.CAP_PROP_POS_FRAMES, start)
+
+        tracker = FaceTracker()
+        records = []
+        frames = 0
+        try:
+            for index in range(start, start + count):
+                if (index - start) % self.sample_every:
+                    if not capture.grab():
+                        break
+                    continue
+                ok, frame = capture.read()
+                if not ok:
+                    break
+                frames += 1
+
+                faces = self.detect(frame)
+                tracks = tracker.update([box for box, _ in faces])
+                pending = [(track, crop) for (_, crop), track in zip(faces, tracks)
+                           if tracker.needs_recognition(track)]
+                timestamp = started_at + timedelta(seconds=index / fps)
+                for (track, crop), (name, distance) in zip(pending, self.recognize([c for _, c in pending])):
+                    tracker.set_identity(track, name, distance)
+                    if not self.keep(name):
+                        continue
+                    records.append({"name": name, "image": cv2.imencode(".jpg", crop)[1].tobytes(),
+                                    "timestamp": timestamp, "camera": path})
+        finally:
+            capture.release()
+        return records, frames
+
+    def run_images(self, paths):
+        """Recognize every face in a chunk of still images, timestamped with each file's mtime."""
+        records = []
+        for path in paths:
+            frame = cv2.imread(path)
+            if frame is None:
+                print(f"Could not read {path}.", file=sys.stderr)
+                continue
+            timestamp = datetime.fromtimestamp(os.path.getmtime(path))
+            crops = [crop for _, crop in self.detect(frame)]
+            for crop, (name, distance) in zip(crops, self.recognize(crops)):
+                if not self.keep(name):
+                    continue
+                records.append({"name": name, "image": cv2.imencode(".jpg", crop)[1].tobytes(),
+                                "timestamp": timestamp, "camera": path})
+        return records, len(paths)
+
+
+def _init_worker(*args):
+    # A failing initializer would make the pool respawn workers forever; report it per unit instead
+    global _worker, _worker_error
+    try:
+        _worker = BatchWorker(*args)
+    except Exception as e:
+        _worker_error = f"worker failed to start: {e}"
+
+
+def _process_unit(unit):
+    """Run one unit in a worker process; returns (unit, records, frames, error)."""
+    if _worker is None:
+        return unit, [], 0, _worker_error
+    try:
+        if unit[0] == "video":
+            records, frames = _worker.run_video(unit[1], unit[2], unit[3])
+        else:
+            records, frames = _worker.run_images(unit[2])
+        return unit, records, frames, None
+    except Exception as e:
+        return unit, [], 0, str(e)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Recognize faces in recorded video files and image folders.")
+    parser.add_argument("inputs", nargs="+", help="Video files and/or folders of images.")
+    parser.add_argument("--db-path", default=DEFAULT_DB_PATH, help="Known-face gallery folder.")
+    parser.add_argument("--mongo-uri", default="mongodb://localhost:27017/")
+    parser.add_argument("--db-name", default="face_recognition_db")
+    parser.add_argument("--collection", default="recognized_faces")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Worker processes.")
+    parser.add_argument("--sample-every", type=int, default=5, help="Recognize every Nth video frame.")
+    parser.add_argument("--segment-frames", type=int, default=9000, help="Video frames per unit of work.")
+    parser.add_argument("--images-per-unit", type=int, default=200, help="Images per unit of work.")
+    parser.add_argument("--detect-width", type=int, default=640, help="Width frames are detected at.")
+    parser.add_argument("--min-face-size", type=int, default=40, help="Smallest face kept, in pixels.")
+    parser.add_argument("--checkpoint", default="batch_recognize.checkpoint",
+                        help="File listing finished units; rerun with it to resume.")
+    parser.add_argument("--store-unknown", action="store_true",
+                        help="Also store faces that match nobody in the gallery, labelled Unknown.")
+    args = parser.parse_args(argv)
+
+    from face_database_handler import FaceDatabaseHandler
+    from face_gallery import get_gallery
+
+    units = find_units(args.inputs, args.segment_frames, args.images_per_unit)
+    done = load_checkpoint(args.checkpoint)
+    pending = [unit for unit in units if unit_key(unit) not in done]
+    print(f"{len(units)} unit(s) found, {len(units) - len(pending)} already done, {len(pending)} to process.",
+          file=sys.stderr)
+    if not pending:
+        return
+
+    db_handler = FaceDatabaseHandler(args.mongo_uri, args.db_name, args.collection)
+
+    # Embed new gallery images (and build the ANN index) once here; workers only open the result
+    get_gallery(args.db_path)
+
+    started = time.monotonic()
+    frames = faces = failed = 0
+
+    # Spawned, not forked, so every worker builds its own TensorFlow state
+    context = multiprocessing.get_context("spawn")
+    initargs = (args.db_path, args.detect_width, args.min_face_size, args.sample_every, args.store_unknown)
+    with context.Pool(args.workers, initializer=_init_worker, initargs=initargs) as pool, \
+            open(args.checkpoint, "a") as checkpoint:
+        for n, (unit, records, unit_frames, error) in enumerate(pool.imap_unordered(_process_unit, pending), 1):
+            if error is None:
+                try:
+                    db_handler.insert_faces(records)
+                except Exception as e:
+                    error = f"could not store faces: {e}"
+            if error is not None:
+                failed += 1
+                print(f"[{n}/{len(pending)}] {unit_key(unit)} failed: {error}", file=sys.stderr)
+                continue
+
+            # Only stored units are checkpointed, so a rerun retries failed ones
+            checkpoint.write(unit_key(unit) + "\n")
+            checkpoint.flush()
+            frames += unit_frames
+            faces += len(records)
+            elapsed = time.monotonic() - started
+            print(f"[{n}/{len(pending)}] {unit_key(unit)}: {len(records)} face(s), "
+                  f"{frames / elapsed:.1f} frames/s overall", file=sys.stderr)
+
+    elapsed = time.monotonic() - started
+    print(f"Processed {frames} frame(s) and stored {faces} face(s) in {elapsed:.1f}s; "
+          f"{failed} unit(s) failed.", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
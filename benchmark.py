@@ -0,0 +1,142 @@
+"""
+Offline throughput benchmark for the camera pipelines.
+
+Drives CameraFeed, CameraFeed3 and LiveCam from recorded video files or generated
+(synthetic://) frames, with the bundled known_image gallery and an in-memory MongoDB
+stand-in, and prints per-stage timings, FPS and p50/p99 latency as JSON.
+
+    python benchmark.py --frames 300
+    python benchmark.py --pipeline camera3 --source recording.mp4 --output bench.json
+"""
+import argparse
+import json
+import sys
+import time
+from urllib.parse import quote
+
+from face_gallery import DEFAULT_DB_PATH
+from frame_encoder import DEFAULT_PROFILE, PROFILES, encode_frame, multipart_chunk
+from stage_timer import StageRecorder, summarize
+
+PIPELINES = ("camera", "camera3", "livecam")
+
+
+def synthetic_source(db_path, width=1280, height=720, faces=2, fps=30):
+    return f"synthetic://{width}x{height}?fps={fps}&faces={faces}&faces_dir={quote(db_path)}"
+
+
+def open_pipeline(name, source, db_path, recorder):
+    """
+    Build one pipeline and return (frame generator, capture-time lookup, cleanup callback).
+    """
+    if name == "camera":
+        from camera import CameraFeed
+        feed = CameraFeed(source, db_path=db_path, stage_timer=recorder)
+        frames = feed.frames()
+        return frames, lambda: feed.frame_buffer.timestamp, lambda: (frames.close(), feed.release_camera())
+
+    if name == "camera3":
+        from camera3 import CameraFeed3
+        from clip_recorder import NullClipRecorder
+        from face_database_handler import FaceDatabaseHandler
+        db_handler = FaceDatabaseHandler("memory://", "face_recognition_db", "recognized_faces",
+                                         buffered=True, sighting_window=30)
+        # No event clips: the benchmark measures the pipeline, not the disk
+        feed = CameraFeed3(source, db_handler, db_path=db_path, stage_timer=recorder,
+                           clip_recorder=NullClipRecorder())
+        frames = feed.frames()
+
+        def cleanup():
+            frames.close()
+            feed.release_camera()
+            db_handler.close()
+        return frames, lambda: feed.frame_buffer.timestamp, cleanup
+
+    if name == "livecam":
+        from camera2 import LiveCam
+        feed = LiveCam(source, stage_timer=recorder)
+        frames = feed.frames(fps=0)
+        return frames, lambda: None, frames.close
+
+    raise ValueError(f"Unknown pipeline: {name}")
+
+
+def run_pipeline(name, source, db_path, frame_count, warmup, profile):
+    """
+    Pull frames through one pipeline and encode each, as a single viewer would.
+    The first `warmup` frames (model loading, gallery build) are not measured.
+    """
+    recorder = StageRecorder()
+    frames, capture_time, cleanup = open_pipeline(name, source, db_path, recorder)
+
+    latencies = []
+    processed = 0
+    started = None
+    try:
+        while processed < warmup + frame_count:
+            if processed == warmup:
+                recorder.reset()
+                latencies.clear()
+                started = time.monotonic()
+
+            requested = time.monotonic()
+            try:
+                frame = next(frames)
+            except StopIteration:
+                break
+            with recorder.time("encode"):
+                multipart_chunk(encode_frame(frame, profile))
+            done = time.monotonic()
+
+            captured = capture_time()
+            latencies.append(done - (captured if captured is not None else requested))
+            processed += 1
+    finally:
+        cleanup()
+
+    measured = max(0, processed - warmup)
+    elapsed = time.monotonic() - started if started is not None else 0.0
+    return {
+        "pipeline": name,
+        "source": source,
+        "profile": profile,
+        "frames": measured,
+        "seconds": round(elapsed, 3),
+        "fps": round(measured / elapsed, 2) if elapsed > 0 else 0.0,
+        "latency": summarize(latencies),
+        "stages": recorder.summary(),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the camera pipelines offline.")
+    parser.add_argument("--pipeline", action="append", choices=PIPELINES,
+                        help="Pipeline to run (repeatable); defaults to all.")
+    parser.add_argument("--source", action="append",
+                        help="Video file or synthetic:// URL (repeatable); defaults to generated frames.")
+    parser.add_argument("--db-path", default=DEFAULT_DB_PATH, help="Known-face gallery folder.")
+    parser.add_argument("--fps", type=float, default=30,
+                        help="Frame rate of the generated source (0 = as fast as possible).")
+    parser.add_argument("--frames", type=int, default=200, help="Measured frames per run.")
+    parser.add_argument("--warmup", type=int, default=10, help="Unmeasured frames per run.")
+    parser.add_argument("--profile", default=DEFAULT_PROFILE, choices=sorted(PROFILES))
+    parser.add_argument("--output", help="Write the JSON report here instead of stdout.")
+    args = parser.parse_args(argv)
+
+    sources = args.source or [synthetic_source(args.db_path, fps=args.fps)]
+    results = []
+    for name in args.pipeline or PIPELINES:
+        for source in sources:
+            print(f"Benchmarking {name} on {source}...", file=sys.stderr)
+            results.append(run_pipeline(name, source, args.db_path, args.frames, args.warmup, args.profile))
+
+    report = json.dumps({"results": results}, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(report + "\n")
+    else:
+        print(report)
+
+
+if __name__ == "__main__":
+    main()
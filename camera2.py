@@ -1,42 +1,61 @@
-import cv2
+import threading
 import time
+from frame_encoder import encode_frame, multipart_chunk
+from capture_source import open_capture, release_capture
+import metrics
 
 class LiveCam:
-    def __init__(self, url):
+    def __init__(self, url, stage_timer=None, metrics_label=None):
         print("Initializing CameraFeed...")
+        # Per-stage timings go to the /metrics histograms unless a benchmark passes its own recorder,
+        # labelled with the camera id when the registry gives one
+        self.metrics_label = metrics_label if metrics_label is not None else str(url)
+        self.timer = stage_timer or metrics.stage_timer(self.metrics_label)
+
         # Initialize the camera
-        self.camera = cv2.VideoCapture(url)
+        self.camera = open_capture(url)
         if not self.camera.isOpened():
             raise RuntimeError("Could not open camera.")
         print("Camera initialized successfully.")
 
-    def LiveCamFeed(self, fps=30):
-        frame_delay = 1 / fps
+        # Set to end frames() from another thread
+        self.stop_event = threading.Event()
+
+    def frames(self, fps=30):
+        """
+        Generate raw frames (NumPy arrays) at no more than `fps` (unpaced if fps is 0/None).
+        """
+        frame_delay = 1 / fps if fps else 0
         try:
-            while True:
+            while not self.stop_event.is_set():
                 start_time = time.time()
-                ret, frame = self.camera.read()
+                with self.timer.time("capture"):
+                    ret, frame = self.camera.read()
                 if not ret:
                     print("Failed to capture frame.")
                     break
 
-                try:
-                    _, buffer = cv2.imencode('.jpg', frame)
-                    frame = buffer.tobytes()
-                    yield (b'--frame\r\n'
-                           b'Content-Type: image/jpeg\r\n\r\n' + frame + b'\r\n')
-                except Exception as e:
-                    print(f"Error encoding frame: {e}")
-                    break
+                yield frame
 
                 # Control frame rate
                 elapsed_time = time.time() - start_time
                 if elapsed_time < frame_delay:
-                    time.sleep(frame_delay - elapsed_time)
+                    self.stop_event.wait(frame_delay - elapsed_time)
         finally:
             self.release_camera()
 
+    def LiveCamFeed(self, fps=30, profile="full"):
+        for frame in self.frames(fps):
+            try:
+                with self.timer.time("encode"):
+                    chunk = multipart_chunk(encode_frame(frame, profile))
+            except Exception as e:
+                print(f"Error encoding frame: {e}")
+                break
+            yield chunk
+
     def release_camera(self):
-        """Release the camera."""
-        self.camera.release()
-        print("Camera released.")
\ No newline at end of file
+        """Release the camera (safe to call more than once)."""
+        if self.camera.isOpened():
+            release_capture(self.camera)
+            print("Camera released.")
\ No newline at end of file
@@ -1,162 +1,237 @@
 import cv2
-from deepface import DeepFace
 import numpy as np
 import os
-import tempfile
 import threading
-import queue
+from frame_buffer import LatestFrameBuffer
+from face_gallery import DEFAULT_DB_PATH, get_gallery
+from face_tracker import FaceTracker
+from motion_gate import MotionGate
+from inference_service import get_inference_service
+from frame_encoder import encode_frame, multipart_chunk
+from capture_source import open_capture, release_capture
+from clip_recorder import NullClipRecorder
+import metrics
 from face_database_handler import FaceDatabaseHandler  # Import the database handler
 
 
 class CameraFeed3:
-    def __init__(self, url, db_handler):
+    def __init__(self, url, db_handler, db_path=None, stage_timer=None,
+                 detect_width=640, min_face_size=40, clip_recorder=None, metrics_label=None):
         print("Initializing CameraFeed...")
         # Initialize the camera
-        self.camera = cv2.VideoCapture(url)
+        self.source = url
+        self.camera = open_capture(url)
+        self.camera.set(cv2.CAP_PROP_BUFFERSIZE, 1)  # Keep the driver from queueing stale frames
         if not self.camera.isOpened():
             raise RuntimeError(f"Could not open camera at URL: {url}")
         print("Camera initialized successfully.")
 
         # Path to the database of known faces
-        self.db_path = '/home/amir-asadi/PycharmProjects/mega_project/known_image'
+        self.db_path = db_path or DEFAULT_DB_PATH
         if not os.path.exists(self.db_path):
             raise ValueError(f"Database path {self.db_path} does not exist.")
 
+        # Per-stage timings go to the /metrics histograms unless a benchmark passes its own recorder;
+        # the label is the camera id from the registry, falling back to the source
+        self.metrics_label = metrics_label if metrics_label is not None else str(url)
+        self.timer = stage_timer or metrics.stage_timer(self.metrics_label)
+
+        # Known-face embeddings, loaded once and shared by every feed
+        self.gallery = get_gallery(self.db_path)
+
+        # Detection and batched recognition shared with every other camera
+        self.inference = get_inference_service(self.gallery)
+
+        # Tracks faces across frames so each person is recognized once, not every frame
+        self.tracker = FaceTracker()
+
+        # Detection runs on a frame scaled to `detect_width`; recognition crops come from the
+        # full-resolution frame, and faces under `min_face_size` full-resolution pixels are ignored
+        self.detect_width = detect_width
+        self.min_face_size = min_face_size
+
+        # Skips detection on frames where nothing moved, and limits it to the moving regions otherwise
+        self.motion_gate = MotionGate()
+
         # Database handler for storing recognized faces
         self.db_handler = db_handler
 
-        # Queue for inter-thread communication
-        self.frame_queue = queue.Queue(maxsize=10)
+        # Recent frames for the event clip linked from each stored face (written off-thread);
+        # cameras record clips only when given a ClipRecorder, which whoever encodes the
+        # yielded frames feeds (the camera registry's broadcaster)
+        self.clip_recorder = clip_recorder or NullClipRecorder()
+
+        # Latest-frame hand-off between the capture thread and the processing loop
+        self.frame_buffer = LatestFrameBuffer()
+        metrics.register_pipeline(self.metrics_label, self)
         self.stop_event = threading.Event()
 
-        # Thread for frame capture
-        self.capture_thread = threading.Thread(target=self.capture_frames, daemon=True)
-        self.capture_thread.start()
+        # Thread for frame capture, started by frames()
+        self.capture_thread = None
 
         print("CameraFeed initialized successfully.")
 
     def preprocess_frame(self, frame):
         """
         Preprocess the frame to improve performance.
-        - Resize the frame to a smaller resolution.
-        - Convert to grayscale for faster processing (optional).
+        - Scale it down to `detect_width` pixels wide, keeping the aspect ratio.
+        Returns the detection frame and the factor that maps its coordinates back to `frame`.
         """
-        frame = cv2.resize(frame, (640, 480))  # Resize to 640x480 for faster processing
-        # frame = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)  # Optional: Convert to grayscale
-        return frame
+        scale = frame.shape[1] / float(self.detect_width)
+        if scale <= 1:
+            return frame.copy(), 1.0
+        height = int(round(frame.shape[0] / scale))
+        return cv2.resize(frame, (self.detect_width, height), interpolation=cv2.INTER_AREA), scale
+
+    def full_resolution_crop(self, full_frame, box, scale):
+        """Cut a box found on the detection frame out of the full-resolution frame."""
+        x, y, w, h = (int(round(v * scale)) for v in box)
+        return full_frame[max(0, y):y + h, max(0, x):x + w]
 
     def capture_frames(self):
         """
-        Capture frames from the camera and add them to the queue.
+        Capture frames from the camera into the latest-frame buffer.
+        - Frames the processing loop has not picked up yet are overwritten, so frames are
+          skipped in proportion to how long processing takes and latency stays bounded.
         """
-        frame_counter = 0
-        skip_frames = 2  # Process every 2nd frame
-
-        while not self.stop_event.is_set():
-            ret, frame = self.camera.read()
-            if not ret:
-                print("Failed to capture frame. Exiting capture thread.")
-                break
-
-            # Skip frames to reduce processing load
-            if frame_counter % skip_frames == 0:
-                # Preprocess the frame
-                frame = self.preprocess_frame(frame)
-                if not self.frame_queue.full():
-                    self.frame_queue.put(frame)
-                else:
-                    print("Frame queue is full. Dropping frame.")
-
-            frame_counter += 1
+        try:
+            while not self.stop_event.is_set():
+                with self.timer.time("capture"):
+                    ret, frame = self.camera.read()
+                if not ret:
+                    print("Failed to capture frame. Exiting capture thread.")
+                    break
+
+                self.frame_buffer.put(frame)
+        finally:
+            self.frame_buffer.close()
 
     def process_frames(self):
         """
-        Process frames from the queue for face detection and recognition.
+        Process frames from the buffer for face detection and recognition.
         """
         while not self.stop_event.is_set():
-            if not self.frame_queue.empty():
-                frame = self.frame_queue.get()
-
-                try:
-                    # Use DeepFace to extract faces from the frame
-                    extracted_faces = DeepFace.extract_faces(frame, detector_backend="opencv", enforce_detection=False)
-
-                    # Iterate over detected faces
-                    for face in extracted_faces:
-                        # Get the face region and confidence
-                        facial_area = face["facial_area"]
-                        x, y, w, h = facial_area["x"], facial_area["y"], facial_area["w"], facial_area["h"]
+            frame = self.frame_buffer.get(timeout=0.5)
+            if frame is None:
+                if self.frame_buffer.closed:
+                    break
+                continue
+
+            # Preprocess only the frames that are actually processed
+            full_frame = frame
+            frame, scale = self.preprocess_frame(full_frame)
+
+            try:
+                # Only look for faces where something moved since the last frames
+                with self.timer.time("motion"):
+                    regions = self.motion_gate.regions(frame)
+
+                if regions:
+                    # Use DeepFace to extract faces from the moving regions (on the shared detection pool)
+                    with self.timer.time("detect"):
+                        boxes = self.inference.detect_boxes(frame, regions)
+                    boxes = [box for box in boxes if min(box[2], box[3]) * scale >= self.min_face_size]
+
+                    # Link detections to tracks; only new or stale tracks are recognized.
+                    # Faces outside the searched regions stay tracked where they were.
+                    tracks = self.tracker.update(boxes, regions)
+                else:
+                    # Static scene: the faces are where they were last seen
+                    tracks = self.tracker.current()
+                    boxes = [track.box for track in tracks]
+
+                # Submit every face that needs recognition at once so they share a batch
+                pending = []
+                for (x, y, w, h), track in zip(boxes, tracks):
+                    if self.tracker.needs_recognition(track):
+                        # Crop the face from the full-resolution frame, for more detail at range
+                        cropped_face = self.full_resolution_crop(full_frame, (x, y, w, h), scale)
+                        future = self.inference.identify(cropped_face) if cropped_face.size > 0 else None
+                        pending.append((track, cropped_face, future))
+
+                for track, cropped_face, future in pending:
+                    name, distance = self.recognize_face(cropped_face, future)
+                    self.tracker.set_identity(track, name, distance)
+
+                # Draw every tracked face, including those carried outside the searched regions
+                with self.timer.time("annotate"):
+                    for track in self.tracker.current():
+                        x, y, w, h = track.box
+                        name = track.name
 
                         # Draw a rectangle around the face
                         cv2.rectangle(frame, (x, y), (x + w, y + h), (255, 0, 0), 2)
 
-                        # Crop the face from the frame
-                        cropped_face = frame[y:y + h, x:x + w]
-
-                        if cropped_face.size > 0:
-                            # Save the cropped face as a temporary image file
-                            with tempfile.NamedTemporaryFile(delete=False, suffix=".jpg") as tmp_file:
-                                tmp_file_path = tmp_file.name
-                                cv2.imwrite(tmp_file_path, cropped_face)
-
-                            # Perform face recognition using DeepFace
-                            try:
-                                results = DeepFace.find(img_path=tmp_file_path, db_path=self.db_path,
-                                                        enforce_detection=False)
-
-                                if isinstance(results, list) and len(results) > 0:
-                                    # Assuming results is a list of DataFrames, take the first DataFrame
-                                    df = results[0]
-                                    if not df.empty:
-                                        # Get the first row's 'identity' column value
-                                        identity_path = df.iloc[0]['identity']
-                                        name = os.path.basename(identity_path)
-
-                                        # Store the recognized face in MongoDB
-                                        self.db_handler.insert_face(name, tmp_file_path)
-
-                                    else:
-                                        name = "Unknown"
-                                else:
-                                    name = "Unknown"  # Label as unknown if no match is found
-
-                            except Exception as e:
-                                name = "Error"  # In case DeepFace throws an error
-                                print(f"Error with DeepFace: {e}")
-
-                            # Clean up the temporary file
-                            os.unlink(tmp_file_path)
-
-                        else:
-                            name = "No Face Detected"
-
                         # Display the name on the frame
                         cv2.putText(frame, name, (x, y - 10),
                                     cv2.FONT_HERSHEY_SIMPLEX,
                                     0.5, (255, 255, 255), 2)
 
-                except Exception as e:
-                    print(f"Error during face detection or recognition: {e}")
+            except Exception as e:
+                print(f"Error during face detection or recognition: {e}")
+
+            # Yield the annotated frame; encoding is left to the consumer
+            yield frame
+
+    def recognize_face(self, cropped_face, future):
+        """
+        Wait for the gallery match of a cropped face submitted to the inference service.
+        Returns the label to display and the match distance.
+        """
+        if future is None:
+            return "No Face Detected", None
+
+        # Match the face against the in-memory gallery
+        try:
+            with self.timer.time("recognize"):
+                identity_path, distance = future.result()
+        except Exception as e:
+            print(f"Error with DeepFace: {e}")
+            return "Error", None  # In case DeepFace throws an error
 
-                # Encode frame as JPEG for streaming
-                _, buffer = cv2.imencode('.jpg', frame)
-                frame_bytes = buffer.tobytes()
+        if identity_path is None:
+            return "Unknown", distance  # Label as unknown if no match is found
 
-                # Yield the frame for Flask streaming
-                yield (b'--frame\r\n'
-                       b'Content-Type: image/jpeg\r\n\r\n' + frame_bytes + b'\r\n')
+        name = os.path.basename(identity_path)
 
-    def generate_frames(self):
+        # Store the recognized face in MongoDB, linked to a clip of the surrounding seconds
+        with self.timer.time("persist"):
+            clip = self.clip_recorder.trigger(name)
+            self.db_handler.insert_face(name, cropped_face, camera=str(self.source), clip=clip)
+        return name, distance
+
+    def frames(self):
         """
-        Generate frames for streaming.
+        Generate annotated frames (NumPy arrays).
         """
+        # Start the frame capture thread
+        self.capture_thread = threading.Thread(target=self.capture_frames)
+        self.capture_thread.start()
+
         # Process frames in the main thread
-        for frame in self.process_frames():
-            yield frame
+        try:
+            for frame in self.process_frames():
+                yield frame
+        finally:
+            # Stop the capture thread, also when the consumer closes the generator early
+            self.stop_event.set()
+            self.capture_thread.join()
+
+    def generate_frames(self, profile="full"):
+        """
+        Generate JPEG multipart chunks for streaming.
+        """
+        for frame in self.frames():
+            with self.timer.time("encode"):
+                chunk = multipart_chunk(encode_frame(frame, profile))
+            yield chunk
 
     def release_camera(self):
-        """Release the camera."""
+        """Release the camera (safe to call more than once)."""
         self.stop_event.set()  # Signal the capture thread to stop
-        self.capture_thread.join()  # Wait for the capture thread to finish
-        self.camera.release()
-        print("Camera released.")
\ No newline at end of file
+        if self.capture_thread is not None:
+            self.capture_thread.join()  # Wait for the capture thread to finish
+        self.clip_recorder.close()
+        if self.camera.isOpened():
+            release_capture(self.camera)
+            print("Camera released.")
\ No newline at end of file
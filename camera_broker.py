@@ -0,0 +1,231 @@
+import threading
+import time
+
+import metrics
+from frame_encoder import DEFAULT_PROFILE, EncodedFrame
+
+
+class CameraBusy(Exception):
+    """Raised when a camera already has its maximum number of viewers."""
+
+
+class FrameBroadcaster:
+    def __init__(self, source, frames):
+        """
+        Run one camera pipeline and share its output.
+        - `frames` is the pipeline's annotated-frame generator; it is consumed by a single
+          background thread.
+        - Each frame is JPEG-encoded at most once per output profile, however many viewers use it.
+        - Subscribers always get the most recent frame, so a slow viewer skips frames instead of
+          holding the pipeline back.
+        - stop() ends the pipeline; `frames` may offer its own stop() to interrupt a blocking read,
+          and on_frame(encoded_frame) to see every published frame with its cached encodings.
+        """
+        self.source = source
+        self.frames = frames
+        self.timer = metrics.stage_timer(source)
+        self.condition = threading.Condition()
+        self.frame = None
+        self.sequence = 0
+        self.subscribers = 0
+        self.listeners = []
+        self.running = True
+        self.stopping = False
+        self.idle_since = time.monotonic()  # When the last viewer left (None while watched)
+
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        """Pull frames from the pipeline and publish each one to every subscriber."""
+        iterator = iter(self.frames)
+        on_frame = getattr(self.frames, "on_frame", None)
+        try:
+            for frame in iterator:
+                if self.stopping:
+                    break
+                encoded = self.publish(frame)
+                if on_frame is not None:
+                    on_frame(encoded)
+        except Exception as e:
+            print(f"Error in camera pipeline for {self.source!r}: {e}")
+        finally:
+            # Run the pipeline's cleanup (thread joins, capture release) now, not at garbage collection
+            close = getattr(iterator, "close", None)
+            if close is not None:
+                close()
+            with self.condition:
+                self.running = False
+                self.condition.notify_all()
+                listeners = list(self.listeners)
+            for listener in listeners:
+                listener()
+            print(f"Camera pipeline for {self.source!r} stopped.")
+
+    def publish(self, frame):
+        """Make a frame the latest one and wake every viewer; returns its EncodedFrame."""
+        encoded = EncodedFrame(frame, self.timer)
+        with self.condition:
+            self.frame = encoded
+            self.sequence += 1
+            self.condition.notify_all()
+            listeners = list(self.listeners)
+        for listener in listeners:
+            listener()
+        return encoded
+
+    def add_listener(self, callback):
+        """Call `callback()` (from the pipeline thread) after every published frame and when the pipeline stops."""
+        with self.condition:
+            self.listeners.append(callback)
+
+    def remove_listener(self, callback):
+        with self.condition:
+            if callback in self.listeners:
+                self.listeners.remove(callback)
+
+    def attach(self, max_viewers=None):
+        """
+        Count a viewer that reads frames without subscribe() (e.g. the async server).
+        Raises CameraBusy instead when `max_viewers` are already attached.
+        """
+        with self.condition:
+            if max_viewers is not None and self.subscribers >= max_viewers:
+                raise CameraBusy(f"Camera {self.source} already has {max_viewers} viewers.")
+            self.subscribers += 1
+            self.idle_since = None
+
+    def detach(self):
+        with self.condition:
+            self.subscribers -= 1
+            if self.subscribers == 0:
+                self.idle_since = time.monotonic()
+
+    def stop(self):
+        """Ask the pipeline to stop; it finishes its current frame, cleans up and ends the viewers' streams."""
+        self.stopping = True
+        stop = getattr(self.frames, "stop", None)
+        if stop is not None:
+            stop()
+
+    def stop_if_idle(self, idle_timeout):
+        """
+        Stop the pipeline if it has had no viewers for `idle_timeout` seconds; returns True if it did.
+        - The check and `stopping` are set together under the condition; called under the broker's
+          lock, a concurrent reserve() then starts a fresh broadcaster instead of joining this one.
+        """
+        with self.condition:
+            if not self.running or self.stopping or self.subscribers or self.idle_since is None:
+                return False
+            if time.monotonic() - self.idle_since < idle_timeout:
+                return False
+            self.stopping = True
+        self.stop()
+        return True
+
+    def latest(self):
+        """The most recent (EncodedFrame, sequence) pair."""
+        with self.condition:
+            return self.frame, self.sequence
+
+    def subscribe(self, profile=DEFAULT_PROFILE):
+        """
+        Generate multipart chunks in the given output profile for one viewer.
+        """
+        self.attach()
+        try:
+            yield from self.chunks(profile)
+        finally:
+            self.detach()
+
+    def chunks(self, profile=DEFAULT_PROFILE):
+        """Multipart chunks of every new frame until the pipeline stops, for an already attached viewer."""
+        last_sequence = 0
+        while True:
+            with self.condition:
+                self.condition.wait_for(lambda: self.sequence != last_sequence or not self.running)
+                if self.sequence == last_sequence:
+                    break
+                frame, last_sequence = self.frame, self.sequence
+            yield frame.chunk(profile)
+
+
+class ViewerStream:
+    def __init__(self, broadcaster, profile=DEFAULT_PROFILE):
+        """
+        Response body for a viewer whose slot is already attached.
+        - close() gives the slot back, even when the response is dropped before its first
+          chunk (a generator that never started would not run its cleanup). WSGI servers
+          call it when the client goes away.
+        """
+        self.broadcaster = broadcaster
+        self.iterator = broadcaster.chunks(profile)
+        self.lock = threading.Lock()
+        self.closed = False
+
+    def __iter__(self):
+        return self.iterator
+
+    def close(self):
+        with self.lock:
+            if self.closed:
+                return
+            self.closed = True
+        self.iterator.close()
+        self.broadcaster.detach()
+
+
+class CameraBroker:
+    def __init__(self):
+        """Process-wide registry of running camera pipelines, keyed by source URL or index."""
+        self.lock = threading.Lock()
+        self.broadcasters = {}
+
+    def get(self, source, factory):
+        """
+        Return the broadcaster for a source, starting it with `factory()` if it is not running.
+        - `factory` opens the camera and returns its annotated-frame generator; exceptions
+          propagate so the route can report them.
+        """
+        with self.lock:
+            return self._get_locked(source, factory)
+
+    def _get_locked(self, source, factory):
+        broadcaster = self.broadcasters.get(source)
+        if broadcaster is None or not broadcaster.running or broadcaster.stopping:
+            broadcaster = FrameBroadcaster(source, factory())
+            self.broadcasters[source] = broadcaster
+        return broadcaster
+
+    def reserve(self, source, factory, max_viewers=None):
+        """
+        Like get(), but also attach a viewer, so concurrent requests cannot all pass a
+        `max_viewers` check before any of them starts reading (raises CameraBusy).
+        The caller detaches when its viewer leaves.
+        """
+        with self.lock:
+            broadcaster = self._get_locked(source, factory)
+            broadcaster.attach(max_viewers)
+            return broadcaster
+
+    def stream(self, source, factory, profile=DEFAULT_PROFILE):
+        """Subscribe a new viewer to a source."""
+        return self.get(source, factory).subscribe(profile)
+
+    def stop(self, source):
+        """Stop a source's pipeline if it is running."""
+        with self.lock:
+            broadcaster = self.broadcasters.get(source)
+        if broadcaster is not None:
+            broadcaster.stop()
+
+    def viewer_counts(self):
+        with self.lock:
+            broadcasters = list(self.broadcasters.values())
+        return [({"camera": str(b.source)}, b.subscribers) for b in broadcasters if b.running]
+
+
+camera_broker = CameraBroker()
+
+metrics.REGISTRY.callback("camera_viewers", "Viewers subscribed to each running camera.",
+                          ("camera",), camera_broker.viewer_counts)
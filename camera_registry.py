@@ -0,0 +1,232 @@
+import json
+import threading
+import time
+
+import cv2
+import numpy as np
+
+from camera import CameraFeed
+from camera2 import LiveCam
+from camera3 import CameraFeed3
+from camera_broker import CameraBusy, ViewerStream, camera_broker
+from clip_recorder import ClipRecorder
+from frame_encoder import DEFAULT_PROFILE
+
+PIPELINES = ("camera", "camera3", "livecam")
+
+# The feeds the camera page has always shown; a CAMERAS_CONFIG file replaces them
+DEFAULT_CAMERAS = [
+    {"id": "video_feed0", "source": "", "pipeline": "camera"},
+    {"id": "video_feed1", "source": "https://192.168.1.210:8080/video", "pipeline": "livecam"},
+    {"id": "video_feed2", "source": "https://192:8080/video", "pipeline": "camera"},
+    {"id": "video_feed3", "source": 0, "pipeline": "camera3", "clips": True},
+]
+
+
+def placeholder_frame(message, width=640, height=360):
+    """A dark frame with a status message, shown to viewers while a camera is unavailable."""
+    frame = np.zeros((height, width, 3), dtype=np.uint8)
+    cv2.putText(frame, message, (20, height // 2), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (255, 255, 255), 1)
+    return frame
+
+
+class ManagedCamera:
+    def __init__(self, camera_id, source, pipeline="camera", db_handler=None, idle_timeout=30,
+                 max_viewers=None, max_fps=None, detect_width=640, reconnect_initial=1, reconnect_max=60,
+                 clips=False):
+        """
+        One configured camera and its limits.
+        - The pipeline is started on the first viewer and stopped `idle_timeout` seconds after the last one leaves.
+        - A stream that fails to open or drops is retried after `reconnect_initial` seconds, doubling up
+          to `reconnect_max` while it keeps failing.
+        - `max_viewers` caps concurrent viewers and `max_fps` caps how many frames per second the
+          pipeline processes (None for no limit).
+        - With `clips`, a camera3 pipeline records an event clip (under $CLIP_DIR) around each
+          stored face; it is set per camera in its config entry (the built-in video_feed3 records them).
+        """
+        if pipeline not in PIPELINES:
+            raise ValueError(f"Unknown pipeline for camera {camera_id}: {pipeline}")
+        if pipeline == "camera3" and db_handler is None:
+            raise ValueError(f"Camera {camera_id} stores faces and needs a database handler.")
+        self.camera_id = camera_id
+        self.source = source
+        self.pipeline = pipeline
+        self.db_handler = db_handler
+        self.idle_timeout = idle_timeout
+        self.max_viewers = max_viewers
+        self.max_fps = max_fps
+        self.detect_width = detect_width
+        self.reconnect_initial = reconnect_initial
+        self.reconnect_max = reconnect_max
+        self.clips = clips
+
+        self.state = "stopped"
+        self.reconnects = 0
+        self.last_error = None
+
+    def open_feed(self):
+        """Open the camera; returns (feed, its frame generator)."""
+        if self.pipeline == "camera":
+            feed = CameraFeed(self.source, detect_width=self.detect_width, metrics_label=self.camera_id)
+            return feed, feed.frames()
+        if self.pipeline == "camera3":
+            clip_recorder = ClipRecorder(self.camera_id) if self.clips else None
+            feed = CameraFeed3(self.source, self.db_handler, detect_width=self.detect_width,
+                               clip_recorder=clip_recorder, metrics_label=self.camera_id)
+            return feed, feed.frames()
+        feed = LiveCam(self.source, metrics_label=self.camera_id)
+        return feed, feed.frames(fps=self.max_fps or 30)
+
+    def status(self, broadcaster=None):
+        running = broadcaster is not None and broadcaster.running and not broadcaster.stopping
+        return {
+            "id": self.camera_id,
+            "source": str(self.source),
+            "pipeline": self.pipeline,
+            "state": self.state if running else "stopped",
+            "viewers": broadcaster.subscribers if running else 0,
+            "reconnects": self.reconnects,
+            "last_error": self.last_error,
+        }
+
+
+class CameraSession:
+    def __init__(self, camera):
+        """
+        One run of a camera's pipeline, from first viewer to idle shutdown.
+        - Iterating yields annotated frames, reopening the camera with exponential backoff
+          whenever it cannot be opened or its stream ends. Meanwhile viewers get a placeholder
+          frame saying so, rather than a stream that never starts.
+        - stop() ends the iteration from any thread; the feed's thread and capture are always released.
+        """
+        self.camera = camera
+        self.stop_event = threading.Event()
+        self.feed = None
+
+    def __iter__(self):
+        camera = self.camera
+        delay = camera.reconnect_initial
+        min_interval = 1.0 / camera.max_fps if camera.max_fps else 0
+        while not self.stop_event.is_set():
+            camera.state = "connecting"
+            try:
+                feed, frames = camera.open_feed()
+            except Exception as e:
+                print(f"Could not open camera {camera.camera_id}: {e}")
+                camera.last_error = f"Could not open camera: {e}"
+            else:
+                self.feed = feed
+                if self.stop_event.is_set():
+                    feed.stop_event.set()
+                try:
+                    last = 0.0
+                    for frame in frames:
+                        camera.state = "streaming"
+                        camera.last_error = None
+                        delay = camera.reconnect_initial  # Connected again: the next failure starts over
+                        wait = last + min_interval - time.monotonic()
+                        if wait > 0 and self.stop_event.wait(wait):
+                            break
+                        last = time.monotonic()
+                        yield frame
+                        if self.stop_event.is_set():
+                            break
+                finally:
+                    frames.close()
+                    feed.release_camera()
+                    self.feed = None
+                if self.stop_event.is_set():
+                    break
+                print(f"Stream from camera {camera.camera_id} ended.")
+                camera.last_error = "Stream ended"
+
+            camera.state = "reconnecting"
+            camera.reconnects += 1
+            print(f"Reconnecting camera {camera.camera_id} in {delay:g}s.")
+            yield placeholder_frame(f"{camera.camera_id} unavailable, retrying in {delay:g}s")
+            if self.stop_event.wait(delay):
+                break
+            delay = min(delay * 2, camera.reconnect_max)
+        camera.state = "stopped"
+
+    def on_frame(self, encoded):
+        """Hand each published frame to the feed's clip recorder, which reuses its cached JPEG."""
+        feed = self.feed
+        recorder = getattr(feed, "clip_recorder", None)
+        if recorder is not None:
+            recorder.add(encoded)
+
+    def stop(self):
+        self.stop_event.set()
+        feed = self.feed
+        if feed is not None:
+            feed.stop_event.set()
+
+
+class CameraRegistry:
+    def __init__(self, cameras, broker=camera_broker, reap_interval=1.0):
+        """
+        The configured cameras, run through the shared broker under their ids.
+        - A background reaper stops pipelines that have had no viewers for their idle timeout,
+          which joins their threads and releases their captures.
+        """
+        self.cameras = {camera.camera_id: camera for camera in cameras}
+        self.broker = broker
+        self.reap_interval = reap_interval
+        self.stop_event = threading.Event()
+        self.reaper = threading.Thread(target=self._reap, daemon=True)
+        self.reaper.start()
+
+    @classmethod
+    def from_config(cls, path=None, db_handler=None):
+        """
+        Build the registry from a JSON file ({"cameras": [{"id", "source", "pipeline", ...limits}]}),
+        or from DEFAULT_CAMERAS without one.
+        """
+        entries = DEFAULT_CAMERAS
+        if path:
+            with open(path) as f:
+                entries = json.load(f)["cameras"]
+        cameras = []
+        for entry in entries:
+            options = {key: value for key, value in entry.items() if key not in ("id", "source")}
+            cameras.append(ManagedCamera(entry["id"], entry["source"], db_handler=db_handler, **options))
+        return cls(cameras)
+
+    def open(self, camera_id):
+        """
+        The running broadcaster for a camera, starting its pipeline if needed, with a viewer
+        slot already attached; the caller must detach() when its viewer leaves.
+        Raises KeyError for an unknown camera and CameraBusy when it is at max_viewers.
+        """
+        camera = self.cameras[camera_id]
+        return self.broker.reserve(camera_id, lambda: CameraSession(camera), camera.max_viewers)
+
+    def stream(self, camera_id, profile=DEFAULT_PROFILE):
+        """Multipart chunks of a camera for one new viewer; closing the stream frees the slot."""
+        return ViewerStream(self.open(camera_id), profile)
+
+    def status(self):
+        with self.broker.lock:
+            broadcasters = dict(self.broker.broadcasters)
+        return [camera.status(broadcasters.get(camera_id)) for camera_id, camera in self.cameras.items()]
+
+    def _reap(self):
+        while not self.stop_event.wait(self.reap_interval):
+            # Under the broker lock, so no viewer can be reserved on a pipeline being stopped
+            with self.broker.lock:
+                for camera_id, camera in self.cameras.items():
+                    broadcaster = self.broker.broadcasters.get(camera_id)
+                    if broadcaster is not None and broadcaster.stop_if_idle(camera.idle_timeout):
+                        print(f"Camera {camera_id} has had no viewers for {camera.idle_timeout}s. Stopping it.")
+
+    def shutdown(self, timeout=5):
+        """Stop the reaper and every running camera, waiting up to `timeout` seconds for each."""
+        self.stop_event.set()
+        with self.broker.lock:
+            broadcasters = [self.broker.broadcasters[camera_id] for camera_id in self.cameras
+                            if camera_id in self.broker.broadcasters]
+        for broadcaster in broadcasters:
+            broadcaster.stop()
+        for broadcaster in broadcasters:
+            broadcaster.thread.join(timeout)
@@ -0,0 +1,160 @@
+import os
+import threading
+import time
+from urllib.parse import urlparse, parse_qs
+
+import cv2
+import numpy as np
+
+from embedding_store import IMAGE_EXTENSIONS
+from metrics import REGISTRY
+
+SYNTHETIC_SCHEME = "synthetic://"
+
+
+class SyntheticCapture:
+    def __init__(self, width=1280, height=720, fps=0, faces_dir=None, faces=2, frames=0):
+        """
+        A cv2.VideoCapture stand-in that generates frames.
+        - Faces from `faces_dir` (e.g. the known_image gallery) are pasted onto a noisy
+          background and drift across the frame, so detection and recognition get real work.
+        - `fps` > 0 paces read() like a live camera; 0 returns frames as fast as possible.
+        - `frames` > 0 ends the stream after that many frames.
+        """
+        self.width = width
+        self.height = height
+        self.fps = fps
+        self.max_frames = frames
+        self.frame_index = 0
+        self.next_frame_time = time.monotonic()
+        self.opened = True
+
+        rng = np.random.default_rng(0)
+        self.background = rng.integers(40, 90, size=(height, width, 3), dtype=np.uint8)
+        self.faces = self._load_faces(faces_dir, faces)
+        self.velocities = [(int(rng.integers(2, 6)), int(rng.integers(1, 4))) for _ in self.faces]
+
+    def _load_faces(self, faces_dir, count):
+        faces = []
+        if faces_dir is None or count <= 0:
+            return faces
+        for root, _, files in os.walk(faces_dir):
+            for file in sorted(files):
+                if not file.lower().endswith(IMAGE_EXTENSIONS):
+                    continue
+                image = cv2.imread(os.path.join(root, file))
+                if image is None:
+                    continue
+                # Scale each face so it fits comfortably in the frame
+                scale = min(1.0, (self.height / 2) / image.shape[0], (self.width / 3) / image.shape[1])
+                faces.append(cv2.resize(image, None, fx=scale, fy=scale))
+                if len(faces) == count:
+                    return faces
+        return faces
+
+    def isOpened(self):
+        return self.opened
+
+    def set(self, prop, value):
+        return False
+
+    def get(self, prop):
+        if prop == cv2.CAP_PROP_FPS:
+            return float(self.fps)
+        if prop == cv2.CAP_PROP_FRAME_WIDTH:
+            return float(self.width)
+        if prop == cv2.CAP_PROP_FRAME_HEIGHT:
+            return float(self.height)
+        return 0.0
+
+    def read(self):
+        if not self.opened or (self.max_frames and self.frame_index >= self.max_frames):
+            return False, None
+
+        if self.fps > 0:
+            delay = self.next_frame_time - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            self.next_frame_time = max(self.next_frame_time, time.monotonic()) + 1.0 / self.fps
+
+        frame = self.background.copy()
+        for face, (vx, vy) in zip(self.faces, self.velocities):
+            h, w = face.shape[:2]
+            x = self._bounce(self.frame_index * vx, self.width - w)
+            y = self._bounce(self.frame_index * vy, self.height - h)
+            frame[y:y + h, x:x + w] = face
+
+        self.frame_index += 1
+        return True, frame
+
+    @staticmethod
+    def _bounce(position, limit):
+        if limit <= 0:
+            return 0
+        position %= 2 * limit
+        return position if position <= limit else 2 * limit - position
+
+    def release(self):
+        self.opened = False
+
+
+def parse_synthetic_url(url, faces_dir=None):
+    """
+    Build a SyntheticCapture from a URL such as
+    synthetic://1280x720?fps=25&faces=2&frames=500&faces_dir=known_image
+    """
+    parsed = urlparse(url)
+    options = {key: values[-1] for key, values in parse_qs(parsed.query).items()}
+    width, height = 1280, 720
+    if parsed.netloc:
+        width, height = (int(value) for value in parsed.netloc.lower().split("x"))
+    return SyntheticCapture(width=width, height=height,
+                            fps=float(options.get("fps", 0)),
+                            faces_dir=options.get("faces_dir", faces_dir),
+                            faces=int(options.get("faces", 2)),
+                            frames=int(options.get("frames", 0)))
+
+
+_captures = set()
+_captures_lock = threading.Lock()
+
+
+def _forget_closed():
+    """Drop captures that were released or never opened; call with _captures_lock held."""
+    for capture in [capture for capture in _captures if not capture.isOpened()]:
+        _captures.discard(capture)
+
+
+def open_capture(source):
+    """
+    Open a camera source.
+    - synthetic:// URLs give a generated SyntheticCapture (see parse_synthetic_url).
+    - Anything else (device index, stream URL, recorded video file) goes to cv2.VideoCapture.
+    - Captures are tracked for /metrics until release_capture(); failed opens are forgotten on
+      the next open, so a camera retrying with backoff does not grow the set.
+    """
+    if isinstance(source, str) and source.startswith(SYNTHETIC_SCHEME):
+        capture = parse_synthetic_url(source)
+    else:
+        capture = cv2.VideoCapture(source)
+    with _captures_lock:
+        _forget_closed()
+        _captures.add(capture)
+    return capture
+
+
+def release_capture(capture):
+    """Release a capture from open_capture() and stop tracking it."""
+    capture.release()
+    with _captures_lock:
+        _captures.discard(capture)
+
+
+def _open_captures():
+    """Count captures that are still open, forgetting released ones."""
+    with _captures_lock:
+        _forget_closed()
+        return [({}, len(_captures))]
+
+
+REGISTRY.callback("camera_capture_handles_open", "VideoCapture handles currently open.", (), _open_captures)
@@ -0,0 +1,204 @@
+import os
+import queue
+import re
+import threading
+import time
+from collections import deque
+from datetime import datetime
+
+import cv2
+import numpy as np
+
+import metrics
+
+DEFAULT_CLIP_DIR = os.environ.get("CLIP_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "clips"))
+
+
+class ClipWriter:
+    def __init__(self, max_pending=8):
+        """
+        Background writer that turns buffered JPEG frames into MJPG .avi files.
+        - A camera reserves a slot when a clip starts; with `max_pending` clips already recording
+          or queued the new one is refused, so disk stalls never reach a pipeline and no face
+          record links a clip that will not be written.
+        - Reserved clips are handed over without waiting and always written.
+        - Clips are written under a temporary name and renamed when complete.
+        - close() writes every clip handed over so far before the thread stops.
+        """
+        self.queue = queue.Queue()
+        self.slots = threading.BoundedSemaphore(max_pending)
+        self.dropped = 0
+        self.closed = False
+        self.lock = threading.Lock()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+        metrics.REGISTRY.callback("clip_write_queue_depth", "Event clips waiting to be written to disk.",
+                                  (), lambda: [({}, self.queue.qsize())])
+        metrics.REGISTRY.callback("clips_dropped_total", "Event clips not recorded because the writer was behind.",
+                                  (), lambda: [({}, self.dropped)], kind="counter")
+
+    def reserve(self):
+        """Claim a slot for a new clip; returns False (and the clip should not be recorded) if there is none."""
+        with self.lock:
+            if not self.closed and self.slots.acquire(blocking=False):
+                return True
+            self.dropped += 1
+        print("Clip writer is behind. Not recording a clip.")
+        return False
+
+    def submit(self, path, frames):
+        """Queue a reserved clip of (timestamp, jpeg bytes) frames for writing."""
+        self.queue.put((path, frames))
+
+    def _run(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                break
+            path, frames = item
+            try:
+                self.write(path, frames)
+            except Exception as e:
+                print(f"Error writing clip {path}: {e}")
+            finally:
+                self.slots.release()
+
+    def close(self, timeout=None):
+        """Stop taking clips and wait until the ones already handed over are on disk."""
+        with self.lock:
+            if self.closed:
+                return
+            self.closed = True
+        self.queue.put(None)
+        self.thread.join(timeout)
+
+    @staticmethod
+    def write(path, frames):
+        if not frames:
+            return
+        first = cv2.imdecode(np.frombuffer(frames[0][1], dtype=np.uint8), cv2.IMREAD_COLOR)
+        height, width = first.shape[:2]
+        duration = frames[-1][0] - frames[0][0]
+        fps = (len(frames) - 1) / duration if duration > 0 else 1.0
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = os.path.splitext(path)[0] + ".part.avi"
+        video = cv2.VideoWriter(tmp_path, cv2.VideoWriter_fourcc(*"MJPG"), fps, (width, height))
+        try:
+            for _, jpeg in frames:
+                frame = cv2.imdecode(np.frombuffer(jpeg, dtype=np.uint8), cv2.IMREAD_COLOR)
+                if frame.shape[:2] != (height, width):
+                    frame = cv2.resize(frame, (width, height))
+                video.write(frame)
+        finally:
+            video.release()
+        os.replace(tmp_path, path)
+
+
+_writer = None
+_writer_lock = threading.Lock()
+
+
+def get_clip_writer():
+    """Return the process-wide clip writer, starting it on first use."""
+    global _writer
+    with _writer_lock:
+        if _writer is None:
+            _writer = ClipWriter()
+        return _writer
+
+
+def close_clip_writer():
+    """Flush the process-wide clip writer, if it was started; register it to run after the cameras stop."""
+    with _writer_lock:
+        writer = _writer
+    if writer is not None:
+        writer.close()
+
+
+class NullClipRecorder:
+    """Stands in for a ClipRecorder on cameras that do not record clips."""
+
+    def add(self, frame):
+        pass
+
+    def trigger(self, label):
+        return None
+
+    def close(self):
+        pass
+
+
+class ClipRecorder:
+    def __init__(self, camera, clip_dir=None, pre_roll=5.0, post_roll=5.0, max_clip_seconds=60,
+                 max_fps=10, writer=None):
+        """
+        Per-camera event clips around recognitions.
+        - Published frames are kept JPEG-encoded in a ring buffer covering `pre_roll` seconds,
+          sampled at no more than `max_fps`, so a camera's buffer never outgrows that many frames.
+          The JPEG is the EncodedFrame's cached "full" encoding, shared with the viewers.
+        - trigger() starts a clip from the buffered pre-roll and keeps adding frames until
+          `post_roll` seconds after the latest trigger (at most `max_clip_seconds` in all).
+        - Finished clips go to the shared ClipWriter; nothing here touches the disk.
+        """
+        self.camera = re.sub(r"[^A-Za-z0-9._-]", "_", str(camera)) or "camera"
+        self.clip_dir = clip_dir or DEFAULT_CLIP_DIR
+        self.pre_roll = pre_roll
+        self.post_roll = post_roll
+        self.max_clip_seconds = max_clip_seconds
+        self.min_interval = 1.0 / max_fps
+        self.writer = writer or get_clip_writer()
+
+        self.lock = threading.Lock()
+        self.frames = deque(maxlen=max(1, int(pre_roll * max_fps)))
+        self.last_added = 0.0
+        self.event = None
+
+    def add(self, encoded):
+        """Offer a published EncodedFrame; frames arriving faster than max_fps are skipped."""
+        now = time.time()
+        if now - self.last_added < self.min_interval:
+            return
+        self.last_added = now
+        buffer = encoded.jpeg("full")
+        with self.lock:
+            self.frames.append((now, buffer))
+            if self.event is not None:
+                self.event["frames"].append((now, buffer))
+                if now >= self.event["until"]:
+                    self._finish()
+
+    def trigger(self, label):
+        """
+        Record a clip around now, or extend the one in progress.
+        Returns the path the clip will be written to, or None if the writer has no room for it.
+        """
+        now = time.time()
+        with self.lock:
+            if self.event is not None:
+                self.event["until"] = min(now + self.post_roll, self.event["ends_by"])
+                return self.event["path"]
+            if not self.writer.reserve():
+                return None
+
+            name = re.sub(r"[^A-Za-z0-9._-]", "_", os.path.splitext(str(label))[0]) or "face"
+            stamp = datetime.fromtimestamp(now).strftime("%Y%m%d-%H%M%S")
+            path = os.path.join(self.clip_dir, f"{self.camera}_{stamp}_{name}.avi")
+            self.event = {
+                "path": path,
+                "frames": [entry for entry in self.frames if entry[0] >= now - self.pre_roll],
+                "until": now + self.post_roll,
+                "ends_by": now + self.max_clip_seconds,
+            }
+            return path
+
+    def _finish(self):
+        self.writer.submit(self.event["path"], self.event["frames"])
+        self.event = None
+
+    def close(self):
+        """Hand over a clip still in progress, e.g. when the camera stops."""
+        with self.lock:
+            if self.event is not None:
+                self._finish()
@@ -1,12 +1,64 @@
-from pymongo import MongoClient
+from collections import OrderedDict
+import threading
+import time
+from pymongo import ASCENDING
 from bson.objectid import ObjectId
 from werkzeug.security import generate_password_hash, check_password_hash
+from mongo_client import get_client
+
+class UserCache:
+    def __init__(self, max_size=1024, ttl=60):
+        """Small LRU cache of user documents that expire after `ttl` seconds."""
+        self.max_size = max_size
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            expires_at, user = entry
+            if expires_at < time.monotonic():
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return user
+
+    def put(self, key, user):
+        with self.lock:
+            self.entries[key] = (time.monotonic() + self.ttl, user)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+    def invalidate(self, key):
+        with self.lock:
+            self.entries.pop(key, None)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
 
 class AuthenticationDB:
-    def __init__(self, db_uri='mongodb://localhost:27017/', db_name='authentication_db', collection_name='users'):
-        self.client = MongoClient(db_uri)  # Connect to the MongoDB client
+    def __init__(self, db_uri='mongodb://localhost:27017/', db_name='authentication_db', collection_name='users',
+                 cache_size=1024, cache_ttl=60):
+        self.client = get_client(db_uri)  # Shared, pooled MongoDB client
         self.db = self.client[db_name]
         self.collection = self.db[collection_name]
+        self.user_cache = UserCache(cache_size, cache_ttl)  # Session users, looked up on every page hit
+        self.ensure_indexes()
+
+    def ensure_indexes(self):
+        """Unique indexes so username/email lookups are index scans, not collection scans"""
+        try:
+            self.collection.create_index([('username', ASCENDING)], unique=True)
+            # Email is optional, so only documents that actually have one must be unique
+            self.collection.create_index([('email', ASCENDING)], unique=True,
+                                         partialFilterExpression={'email': {'$type': 'string'}})
+        except Exception as e:
+            print(f"Error creating user indexes: {e}")
 
     def create_user(self, username, password, email=None):
         """Create a new user with a hashed password"""
@@ -30,11 +82,24 @@ class AuthenticationDB:
         return user
 
     def get_user_by_id(self, user_id):
-        """Get user data by _id"""
+        """Get user data by _id (served from the session-user cache when possible)"""
+        cached = self.user_cache.get(str(user_id))
+        if cached is not None:
+            return cached
         try:
             object_id = ObjectId(user_id)  # Convert the user_id string to ObjectId
             user = self.collection.find_one({'_id': object_id})
+            if user is not None:
+                self.user_cache.put(str(user_id), user)
             return user
         except Exception as e:
             print(f"Error: {e}")
             return None
+
+    def cache_user(self, user):
+        """Seed the cache with a user just read, e.g. at login"""
+        self.user_cache.put(str(user['_id']), user)
+
+    def invalidate_user(self, user_id):
+        """Drop a user from the cache, e.g. after it changes or its session ends"""
+        self.user_cache.invalidate(str(user_id))
@@ -1,17 +1,13 @@
-from pymongo import MongoClient
+from face_database_handler import FaceDatabaseHandler
 
-# Connect to the MongoDB server
-client = MongoClient('mongodb://localhost:27017')
+# Connect to the MongoDB server (also makes sure the query indexes exist)
+db_handler = FaceDatabaseHandler('mongodb://localhost:27017', 'face_recognition_db', 'recognized_faces')
 
-# Access the database and collection
-my_db = client['face_recognition_db']
-my_collection = my_db['recognized_faces']
-
-# Iterate through the documents in the collection
-for item in my_collection.find():
+# Stream the documents, newest first, without their image bytes
+for item in db_handler.query.export():
     # Access specific fields (e.g., 'name' and 'time')
     name = item.get('name')  # Use .get() to safely access the field
     time = item.get('timestamp')  # Use .get() to avoid KeyError if the field is missing
 
     # Print the values
-    print(f"Name: {name}, Time: {time}")
\ No newline at end of file
+    print(f"Name: {name}, Time: {time}")
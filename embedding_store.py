@@ -0,0 +1,241 @@
+import hashlib
+import json
+import os
+import pickle
+import shutil
+import tempfile
+import threading
+from contextlib import contextmanager
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows: only threads in this process are serialized
+    fcntl = None
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png")
+
+
+class EmbeddingStore:
+    def __init__(self, db_path, model_name="VGG-Face", detector_backend="opencv"):
+        """
+        Persistent gallery embeddings for the images under db_path.
+        - Embeddings live in one float32 .npy file (L2-normalised rows) that is memory-mapped
+          read-only on load, so every worker process shares it through the page cache.
+        - A JSON sidecar maps each row to its image (relative path, size, mtime).
+        - sync() only embeds images that are new or changed; removed images just lose their row.
+        - A lock file next to the store serializes sync() across processes, and readers take it
+          shared, so nobody sees the array of one version with the table of another.
+        """
+        self.db_path = db_path
+        self.model_name = model_name
+        self.detector_backend = detector_backend
+        self.lock = threading.Lock()
+
+        tag = f"{model_name}_{detector_backend}".replace("-", "").lower()
+        self.array_file = os.path.join(db_path, f"embeddings_{tag}.npy")
+        self.table_file = os.path.join(db_path, f"embeddings_{tag}.json")
+        self.lock_file = os.path.join(db_path, f"embeddings_{tag}.lock")
+
+        self.entries = []
+        self.embeddings = np.zeros((0, 0), dtype=np.float32)
+        self.load()
+
+    @contextmanager
+    def _file_lock(self, exclusive):
+        """Hold the store's lock file; a shared hold is skipped if db_path is read-only."""
+        if fcntl is None:
+            yield
+            return
+        try:
+            handle = open(self.lock_file, "a")
+        except OSError:
+            if exclusive:
+                raise
+            yield
+            return
+        try:
+            fcntl.flock(handle, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            yield
+        finally:
+            handle.close()  # Also releases the lock
+
+    def load(self):
+        """Memory-map the stored embeddings and read the identity table."""
+        with self._file_lock(exclusive=False):
+            self._read()
+
+    def _read(self):
+        if not (os.path.exists(self.array_file) and os.path.exists(self.table_file)):
+            self.entries = []
+            self.embeddings = np.zeros((0, 0), dtype=np.float32)
+            return
+        with open(self.table_file) as f:
+            table = json.load(f)
+        self.entries = table["entries"]
+        self.embeddings = np.load(self.array_file, mmap_mode="r")
+
+    def identities(self):
+        """Absolute image path for every row."""
+        return [os.path.join(self.db_path, entry["path"]) for entry in self.entries]
+
+    def fingerprint(self):
+        """Hash of the identity table; changes whenever the stored gallery changes."""
+        if not os.path.exists(self.table_file):
+            return ""
+        with open(self.table_file, "rb") as f:
+            return hashlib.sha1(f.read()).hexdigest()
+
+    def scan(self):
+        """Current images on disk as {relative path: (size, mtime)}."""
+        files = {}
+        for root, _, names in os.walk(self.db_path):
+            for name in sorted(names):
+                if not name.lower().endswith(IMAGE_EXTENSIONS):
+                    continue
+                path = os.path.join(root, name)
+                stat = os.stat(path)
+                files[os.path.relpath(path, self.db_path)] = (stat.st_size, stat.st_mtime)
+        return files
+
+    def sync(self, embed):
+        """
+        Bring the store in line with the images on disk.
+        - `embed(path)` returns one embedding (or None if no face was found) and is called
+          only for images that are new or whose size/mtime changed.
+        Returns True when the store changed.
+        """
+        with self.lock, self._file_lock(exclusive=True):
+            self._read()  # Another process may have synced since this one loaded
+            files = self.scan()
+            rows = {entry["path"]: i for i, entry in enumerate(self.entries)}
+            seed = self._seed_embeddings(files) if not self.entries else {}
+
+            entries = []
+            vectors = []
+            changed = set(rows) - set(files)  # Removed images
+            for path, (size, mtime) in sorted(files.items()):
+                row = rows.get(path)
+                if row is not None and self.entries[row]["size"] == size and self.entries[row]["mtime"] == mtime:
+                    vector = self.embeddings[row]
+                else:
+                    changed.add(path)
+                    vector = seed.get(path)
+                    if vector is None:
+                        try:
+                            vector = embed(os.path.join(self.db_path, path))
+                        except Exception as e:
+                            print(f"Error embedding {path}: {e}")
+                            vector = None
+                    if vector is None:
+                        continue
+                entries.append({"path": path, "size": size, "mtime": mtime})
+                vectors.append(np.asarray(vector, dtype=np.float32))
+
+            if not changed:
+                return False
+
+            self._write(entries, vectors)
+            self._read()
+            print(f"Embedding store updated: {len(changed)} image(s) changed, {len(self.entries)} total.")
+            return True
+
+    def _seed_embeddings(self, files):
+        """
+        Embeddings from DeepFace's representations pickle, keyed by path relative to db_path,
+        so that building the store for the first time does not re-embed the whole gallery.
+        - The pickle holds absolute paths from wherever it was built; each one is matched to
+          the image in `files` sharing its longest trailing path, and entries whose image is
+          no longer on disk are dropped.
+        - A vector is only reused when the entry's hash still matches the image file.
+        """
+        file_name = f"ds_model_{self.model_name}_detector_{self.detector_backend}" \
+                    f"_aligned_normalization_base_expand_0.pkl".replace("-", "").lower()
+        pkl_path = os.path.join(self.db_path, file_name)
+        if not os.path.exists(pkl_path):
+            return {}
+        with open(pkl_path, "rb") as f:
+            representations = pickle.load(f)
+
+        seed = {}
+        for r in representations:
+            if r.get("embedding") is None:
+                continue
+            path = self._resolve_identity(r["identity"], files)
+            if path is None or path in seed:
+                continue
+            if r.get("hash") in self._file_hashes(os.path.join(self.db_path, path)):
+                seed[path] = r["embedding"]
+        return seed
+
+    @staticmethod
+    def _file_hashes(path):
+        """
+        The hashes DeepFace may have recorded for a file: newer versions hash its
+        size/ctime/mtime, older ones its contents.
+        """
+        stat = os.stat(path)
+        properties = f"{stat.st_size}-{stat.st_ctime}-{stat.st_mtime}"
+        with open(path, "rb") as f:
+            content = f.read()
+        return {hashlib.sha1(properties.encode("utf-8")).hexdigest(), hashlib.sha1(content).hexdigest()}
+
+    def _resolve_identity(self, identity, files):
+        """The relative path in `files` that `identity` points to, or None if it is gone."""
+        if os.path.isabs(identity) and os.path.exists(identity):
+            path = os.path.relpath(identity, self.db_path)
+            return path if path in files else None
+        parts = os.path.normpath(identity).split(os.sep)
+        for start in range(len(parts)):
+            path = os.path.join(*parts[start:])
+            if path in files:
+                return path
+        return None
+
+    def _write(self, entries, vectors):
+        """Write the new array and table to temporary files, then swap them in atomically."""
+        if vectors:
+            matrix = np.stack(vectors)
+            norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+            norms[norms == 0] = 1.0
+            matrix = (matrix / norms).astype(np.float32)
+        else:
+            matrix = np.zeros((0, 0), dtype=np.float32)
+
+        array_fd, array_tmp = tempfile.mkstemp(dir=self.db_path, prefix=".embeddings-", suffix=".npy")
+        table_fd, table_tmp = tempfile.mkstemp(dir=self.db_path, prefix=".embeddings-", suffix=".json")
+        try:
+            with os.fdopen(array_fd, "wb") as f:
+                np.save(f, matrix)
+            with os.fdopen(table_fd, "w") as f:
+                json.dump({"model_name": self.model_name, "detector_backend": self.detector_backend,
+                           "entries": entries}, f)
+            os.replace(array_tmp, self.array_file)
+            os.replace(table_tmp, self.table_file)
+        finally:
+            for tmp in (array_tmp, table_tmp):
+                if os.path.exists(tmp):
+                    os.remove(tmp)
+
+    @staticmethod
+    def _check_person(person):
+        """Reject names that are not a single folder inside db_path (e.g. "", ".." or "a/b")."""
+        separators = [sep for sep in (os.sep, os.altsep) if sep]
+        if not person or person in (".", "..") or any(sep in person for sep in separators):
+            raise ValueError(f"Invalid person name: {person!r}")
+
+    def enroll(self, person, image_files, embed):
+        """Copy a person's photos into the gallery and embed just those."""
+        self._check_person(person)
+        person_dir = os.path.join(self.db_path, person)
+        os.makedirs(person_dir, exist_ok=True)
+        for image_file in image_files:
+            shutil.copy2(image_file, os.path.join(person_dir, os.path.basename(image_file)))
+        return self.sync(embed)
+
+    def remove(self, person, embed):
+        """Delete a person's photos from the gallery and drop their rows."""
+        self._check_person(person)
+        shutil.rmtree(os.path.join(self.db_path, person), ignore_errors=True)
+        return self.sync(embed)
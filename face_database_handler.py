@@ -1,29 +1,264 @@
-from pymongo import MongoClient
-from datetime import datetime
+from pymongo.errors import BulkWriteError
+from bson.objectid import ObjectId
+from mongo_client import bulk_write, get_client
+from face_query import FaceQuery
+import metrics
+from datetime import datetime, timedelta
+import queue
+import threading
+import time
+import cv2
+import numpy as np
+
+OVERFLOW_POLICIES = ("block", "drop_newest", "drop_oldest")
 
 class FaceDatabaseHandler:
-    def __init__(self, db_uri, db_name, collection_name):
+    def __init__(self, db_uri, db_name, collection_name, buffered=False, max_queue_size=1000,
+                 flush_size=100, flush_interval=1.0, overflow="drop_newest", sighting_window=None):
+        """
+        Store recognized faces in MongoDB.
+        - With buffered=True, insert_face only enqueues the document; a background writer
+          drains the queue with one bulk write every `flush_size` documents or `flush_interval` seconds.
+        - `overflow` decides what happens when the queue is full: block the caller,
+          drop the new document, or drop the oldest queued one.
+        - With `sighting_window` (seconds), repeated detections of a name on the same camera
+          within the window update one sighting document (first_seen, last_seen, hits and the
+          best-quality image) instead of inserting a document per detection.
+        """
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError(f"Unknown overflow policy: {overflow}")
 
-        self.client = MongoClient(db_uri)
+        # Shared, pooled client (memory:// gives an in-process stand-in for benchmarks and load tests)
+        self.client = get_client(db_uri)
         self.db = self.client[db_name]
         self.collection = self.db[collection_name]
 
-    def insert_face(self, name, image_path, timestamp=None):
+        # Indexed, paginated reads (reports, exports, the /api/faces routes)
+        self.query = FaceQuery(self.collection)
+        self.query.ensure_indexes()
+
+        self.buffered = buffered
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self.overflow = overflow
+        self.dropped = 0
+
+        self.sighting_window = timedelta(seconds=sighting_window) if sighting_window else None
+        self.sightings = {}
+        self.sightings_lock = threading.Lock()
+
+        if self.buffered:
+            self.queue = queue.Queue(maxsize=max_queue_size)
+            self.stop_event = threading.Event()
+            self.writer_thread = threading.Thread(target=self._write_loop, daemon=True)
+            self.writer_thread.start()
+
+            metrics.REGISTRY.callback(
+                "face_db_write_queue_depth", "Face records waiting for the background writer.",
+                ("collection",), lambda: [({"collection": collection_name}, self.queue.qsize())])
+            metrics.REGISTRY.callback(
+                "face_db_records_dropped_total", "Face records dropped because the write queue was full.",
+                ("collection",), lambda: [({"collection": collection_name}, self.dropped)], kind="counter")
+
+    @staticmethod
+    def encode_image(image):
+        """
+        Return the JPEG bytes for an image.
+        - bytes/bytearray/memoryview are taken as an already-encoded buffer.
+        - NumPy arrays (including views into a frame) are encoded in memory.
+        - Strings are still accepted as a path to an image file.
+        """
+        if isinstance(image, (bytes, bytearray, memoryview)):
+            return bytes(image)
+
+        if isinstance(image, np.ndarray):
+            ok, buffer = cv2.imencode('.jpg', image)
+            if not ok:
+                raise ValueError("Could not encode face image.")
+            return buffer.tobytes()
 
+        with open(image, "rb") as image_file:
+            return image_file.read()
+
+    def insert_face(self, name, image, timestamp=None, camera=None, quality=None, clip=None):
+        self._write_op(self._face_op(name, image, timestamp, camera, quality, clip))
+
+    def insert_faces(self, faces):
+        """
+        Store many faces with one bulk write, bypassing the queue (e.g. from a batch job).
+        - `faces` are dicts of insert_face's arguments.
+        Returns once they are written and raises if the write fails, so the caller can
+        record its progress.
+        """
+        operations = [self._face_op(face["name"], face["image"], face.get("timestamp"),
+                                    face.get("camera"), face.get("quality"), face.get("clip")) for face in faces]
+        if operations:
+            try:
+                bulk_write(self.collection, operations, ordered=False)
+            except BulkWriteError as e:
+                self._log_write_errors(operations, e)
+                raise
+
+    def _face_op(self, name, image, timestamp, camera, quality, clip=None):
         if timestamp is None:
             timestamp = datetime.now()
 
-        with open(image_path, "rb") as image_file:
-            image_data = image_file.read()
+        if self.sighting_window is not None:
+            return self._sighting_op(name, image, timestamp, camera, quality, clip)
 
         face_data = {
             "name": name,
-            "image": image_data,
+            "image": self.encode_image(image),
             "timestamp": timestamp
         }
+        if camera is not None:
+            face_data["camera"] = camera
+        if clip is not None:
+            face_data["clip"] = clip  # Event video around the detection, on local disk
 
-        self.collection.insert_one(face_data)
+        return ("insert", face_data)
 
-    def close(self):
+    @staticmethod
+    def image_quality(image):
+        """Default quality score for picking a sighting's thumbnail: the crop's pixel area."""
+        if isinstance(image, np.ndarray):
+            return int(image.shape[0] * image.shape[1])
+        return 0
+
+    def _sighting_op(self, name, image, timestamp, camera, quality, clip=None):
+        """
+        Build the write for one detection in sightings mode.
+        - A detection within the window of the open sighting extends it.
+        - The image is only encoded when it is better than the stored thumbnail.
+        - The sighting links the first event clip recorded during it.
+        - Extensions are upserts that carry the whole sighting, so they still store it
+          if its insert was dropped from a full write queue.
+        """
+        if quality is None:
+            quality = self.image_quality(image)
+        key = (camera, name)
+
+        with self.sightings_lock:
+            sighting = self.sightings.get(key)
+            if sighting is not None and timestamp - sighting["last_seen"] <= self.sighting_window:
+                sighting["last_seen"] = timestamp
+                update = {"$set": {"last_seen": timestamp}, "$inc": {"hits": 1}}
+                if quality > sighting["quality"]:
+                    sighting["quality"] = quality
+                    sighting["image"] = self.encode_image(image)
+                    update["$set"].update({"image": sighting["image"], "quality": quality})
+                if clip is not None and sighting["clip"] is None:
+                    sighting["clip"] = clip
+                    update["$set"]["clip"] = clip
+
+                # Only applied when the insert never made it; fields in $set/$inc must not repeat here
+                on_insert = {"name": name, "camera": camera, "timestamp": sighting["first_seen"],
+                             "first_seen": sighting["first_seen"], "image": sighting["image"],
+                             "quality": sighting["quality"], "clip": sighting["clip"]}
+                update["$setOnInsert"] = {field: value for field, value in on_insert.items()
+                                          if field not in update["$set"] and value is not None}
+                return ("update", {"_id": sighting["_id"]}, update, True)
 
-        self.client.close()
\ No newline at end of file
+            self._expire_sightings(timestamp)
+            sighting_id = ObjectId()
+            encoded = self.encode_image(image)
+            self.sightings[key] = {"_id": sighting_id, "first_seen": timestamp, "last_seen": timestamp,
+                                   "quality": quality, "image": encoded, "clip": clip}
+
+        sighting_data = {
+            "_id": sighting_id,
+            "name": name,
+            "camera": camera,
+            "image": encoded,
+            "quality": quality,
+            "timestamp": timestamp,
+            "first_seen": timestamp,
+            "last_seen": timestamp,
+            "hits": 1
+        }
+        if clip is not None:
+            sighting_data["clip"] = clip
+        return ("insert", sighting_data)
+
+    def _expire_sightings(self, now):
+        """Forget sightings whose window has closed so the lookup table stays small."""
+        expired = [key for key, sighting in self.sightings.items()
+                   if now - sighting["last_seen"] > self.sighting_window]
+        for key in expired:
+            del self.sightings[key]
+
+    def _write_op(self, operation):
+        if self.buffered:
+            self._enqueue(operation)
+        else:
+            self._write([operation])
+
+    def _enqueue(self, operation):
+        if self.overflow == "block":
+            self.queue.put(operation)
+            return
+
+        try:
+            self.queue.put_nowait(operation)
+            return
+        except queue.Full:
+            pass
+
+        if self.overflow == "drop_oldest":
+            try:
+                self.queue.get_nowait()
+            except queue.Empty:
+                pass
+            try:
+                self.queue.put_nowait(operation)
+                self.dropped += 1
+                return
+            except queue.Full:
+                pass
+
+        self.dropped += 1
+        print("Face write queue is full. Dropping record.")
+
+    def _write_loop(self):
+        """Drain the queue in bulk until close() is called and the queue is empty."""
+        while not (self.stop_event.is_set() and self.queue.empty()):
+            batch = []
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.flush_size:
+                try:
+                    if self.stop_event.is_set():
+                        # Shutting down: take whatever is left without waiting out the interval
+                        batch.append(self.queue.get_nowait())
+                        continue
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    batch.append(self.queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            if batch:
+                self._write(batch)
+
+    def _write(self, batch):
+        # Unordered, so one failed record does not stop the rest of the batch
+        try:
+            bulk_write(self.collection, batch, ordered=False)
+        except BulkWriteError as e:
+            self._log_write_errors(batch, e)
+        except Exception as e:
+            print(f"Error writing {len(batch)} face records: {e}")
+
+    @staticmethod
+    def _log_write_errors(batch, error):
+        errors = error.details.get("writeErrors", [])
+        print(f"{len(errors)} of {len(batch)} face records failed to write.")
+        for write_error in errors:
+            operation = batch[write_error["index"]]
+            print(f"  {operation[0]} of {operation[1].get('_id', operation[1].get('name'))} failed: "
+                  f"{write_error.get('errmsg')}")
+
+    def close(self):
+        """Flush buffered writes. The shared client itself is closed at interpreter exit."""
+        if self.buffered:
+            self.stop_event.set()
+            self.writer_thread.join()
@@ -0,0 +1,248 @@
+import os
+import threading
+
+import numpy as np
+
+from ann_index import IVFIndex
+from embedding_store import EmbeddingStore
+from model_registry import models
+
+
+# Distance thresholds used by DeepFace.verify/find for VGG-Face
+DEFAULT_THRESHOLDS = {
+    "cosine": 0.68,
+    "euclidean_l2": 1.17,
+}
+
+INDEX_TYPES = ("auto", "exact", "ivf")
+
+# Known-face folder: $KNOWN_IMAGE_PATH, or the known_image folder next to this file
+DEFAULT_DB_PATH = os.environ.get(
+    "KNOWN_IMAGE_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "known_image"))
+
+
+class FaceGallery:
+    def __init__(self, db_path, model_name="VGG-Face", detector_backend="opencv",
+                 distance_metric="cosine", threshold=None, index="auto", ann_min_size=20000,
+                 n_lists=None, nprobe=8, quantize=False, sync=True):
+        """
+        Load every known-face embedding once into a single matrix.
+        - Rows are L2-normalised so one matrix product scores a face against the whole gallery.
+        - Embeddings persist in an EmbeddingStore next to the images.
+        - `index` picks the search: "exact" scans every row, "ivf" uses an approximate IVFIndex
+          (probing `nprobe` of `n_lists` clusters, optionally int8-`quantize`d), and "auto"
+          switches to IVF once the gallery has `ann_min_size` rows. The IVF index is saved
+          next to the store and rebuilt only when the gallery changes.
+        - With sync=False the stored embeddings are only opened (memory-mapped read-only), never
+          updated, e.g. in worker processes whose parent has already synced the store.
+        """
+        if distance_metric not in DEFAULT_THRESHOLDS:
+            raise ValueError(f"Unsupported distance metric: {distance_metric}")
+        if index not in INDEX_TYPES:
+            raise ValueError(f"Unsupported index type: {index}")
+
+        self.db_path = db_path
+        self.model_name = model_name
+        self.detector_backend = detector_backend
+        self.distance_metric = distance_metric
+        self.threshold = threshold if threshold is not None else DEFAULT_THRESHOLDS[distance_metric]
+        self.index = index
+        self.ann_min_size = ann_min_size
+        self.n_lists = n_lists
+        self.nprobe = nprobe
+        self.quantize = quantize
+        self.sync = sync
+
+        self.identities = []
+        self.embeddings = np.zeros((0, 0), dtype=np.float32)
+        self.ann = None
+        self.lock = threading.Lock()
+        self.stop_event = threading.Event()
+        self.store = EmbeddingStore(db_path, model_name, detector_backend)
+        self.load()
+
+    def load(self):
+        """
+        Load the embedding matrix from the persistent store.
+        - Only images added or changed since the last run are embedded.
+        - The matrix is memory-mapped, so it is shared through the page cache, not copied.
+        """
+        if self.sync:
+            self.store.sync(self.embed_image)
+        self._swap(self.store.identities(), self.store.embeddings)
+        print(f"Face gallery loaded with {len(self.identities)} embeddings.")
+
+    def refresh(self):
+        """Pick up images added, replaced or removed under db_path; returns True if anything changed."""
+        if not self.store.sync(self.embed_image):
+            return False
+        self._swap(self.store.identities(), self.store.embeddings)
+        return True
+
+    def watch(self, interval=60):
+        """Poll db_path on a background thread and refresh the gallery when images change."""
+        def poll():
+            while not self.stop_event.wait(interval):
+                try:
+                    self.refresh()
+                except Exception as e:
+                    print(f"Error refreshing face gallery: {e}")
+
+        thread = threading.Thread(target=poll, daemon=True)
+        thread.start()
+        return thread
+
+    def enroll(self, person, image_files):
+        """Add a person's photos to the gallery, embedding only the new files."""
+        self.store.enroll(person, image_files, self.embed_image)
+        self._swap(self.store.identities(), self.store.embeddings)
+
+    def remove(self, person):
+        """Remove a person's photos from the gallery."""
+        self.store.remove(person, self.embed_image)
+        self._swap(self.store.identities(), self.store.embeddings)
+
+    def _swap(self, identities, embeddings):
+        ann = self._load_ann(embeddings)
+        with self.lock:
+            self.identities = identities
+            self.embeddings = embeddings
+            self.ann = ann
+
+    def snapshot(self):
+        """Identities, embeddings and ANN index that belong together, even while a refresh swaps them."""
+        with self.lock:
+            return self.identities, self.embeddings, self.ann
+
+    def _load_ann(self, embeddings):
+        """The IVF index for these embeddings (loaded if saved and current, else built and saved), or None."""
+        if self.index == "exact" or len(embeddings) == 0:
+            return None
+        if self.index == "auto" and len(embeddings) < self.ann_min_size:
+            return None
+
+        path = self.store.array_file[:-len(".npy")] + (".ivf-int8.npz" if self.quantize else ".ivf.npz")
+        fingerprint = self.store.fingerprint()
+        if os.path.exists(path):
+            try:
+                ann = IVFIndex.load(path, vectors=embeddings)
+                if ann.fingerprint == fingerprint and (ann.codes is not None) == self.quantize:
+                    return ann
+            except Exception as e:
+                print(f"Error loading ANN index {path}: {e}")
+
+        print(f"Building ANN index over {len(embeddings)} embeddings...")
+        ann = IVFIndex.build(embeddings, n_lists=self.n_lists, quantize=self.quantize, fingerprint=fingerprint)
+        ann.save(path)
+        return ann
+
+    def _best_matches(self, queries):
+        """(identity, distance) for each normalised query row, via the ANN index when there is one."""
+        identities, gallery, ann = self.snapshot()
+        if len(identities) == 0:
+            return [(None, None)] * len(queries)
+
+        if ann is not None:
+            best = [ann.search(query, self.nprobe) for query in queries]
+        else:
+            similarities = queries @ gallery.T
+            best = [(int(index), similarities[row, index])
+                    for row, index in enumerate(np.argmax(similarities, axis=1))]
+
+        results = []
+        for index, similarity in best:
+            if index is None:
+                results.append((None, None))
+                continue
+            distance = self._distance(similarity)
+            results.append((identities[index] if distance <= self.threshold else None, distance))
+        return results
+
+    def embed_image(self, path):
+        """Embed a gallery photo (detecting and aligning its face); None if nothing was found."""
+        results = models.deepface().represent(img_path=path, model_name=self.model_name,
+                                              detector_backend=self.detector_backend,
+                                              enforce_detection=False)
+        return results[0]["embedding"] if results else None
+
+    @staticmethod
+    def _normalize(vectors):
+        if vectors.ndim == 1:
+            vectors = vectors[np.newaxis, :]
+        if vectors.size == 0:
+            return vectors.reshape(vectors.shape[0], -1)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return np.ascontiguousarray(vectors / norms, dtype=np.float32)
+
+    def embed(self, face_img):
+        """Embed an already-cropped face (image path or BGR array) without detecting again."""
+        results = models.deepface().represent(img_path=face_img, model_name=self.model_name,
+                                              detector_backend="skip", enforce_detection=False)
+        return np.asarray(results[0]["embedding"], dtype=np.float32)
+
+    def embed_batch(self, face_imgs):
+        """
+        Embed several cropped faces with one forward pass of the recognition model.
+        - Preprocessing mirrors DeepFace.represent with detector_backend="skip".
+        - Falls back to one call per face if the model does not expose its Keras graph.
+        """
+        if len(face_imgs) == 0:
+            return np.zeros((0, self.snapshot()[1].shape[1]), dtype=np.float32)
+
+        model = models.recognizer(self.model_name)
+        keras_model = getattr(model, "model", None)
+        if len(face_imgs) == 1 or keras_model is None or not hasattr(model, "input_shape"):
+            return np.stack([self.embed(face_img) for face_img in face_imgs])
+
+        from deepface.modules import preprocessing
+
+        target_h, target_w = model.input_shape
+        batch = []
+        for face_img in face_imgs:
+            img = face_img[:, :, ::-1]
+            img = preprocessing.resize_image(img=img, target_size=(target_w, target_h))
+            img = preprocessing.normalize_input(img=img, normalization="base")
+            batch.append(img)
+        embeddings = keras_model(np.concatenate(batch, axis=0), training=False).numpy()
+        return embeddings.astype(np.float32)
+
+    def match_batch(self, embeddings):
+        """Vectorised match() for a stack of embeddings; returns a list of (identity, distance)."""
+        if len(embeddings) == 0:
+            return []
+        return self._best_matches(self._normalize(np.asarray(embeddings, dtype=np.float32)))
+
+    def identify_batch(self, face_imgs):
+        """Embed and match several cropped faces at once."""
+        return self.match_batch(self.embed_batch(face_imgs))
+
+    def match(self, embedding):
+        """
+        Find the closest gallery entry for one embedding.
+        Returns (identity, distance); identity is None when nothing is within the threshold.
+        """
+        return self._best_matches(self._normalize(np.asarray(embedding, dtype=np.float32)))[0]
+
+    def _distance(self, similarity):
+        similarity = float(min(max(similarity, -1.0), 1.0))
+        if self.distance_metric == "cosine":
+            return 1.0 - similarity
+        return float(np.sqrt(2.0 - 2.0 * similarity))
+
+    def identify(self, face_img):
+        """Embed a cropped face and match it against the gallery in one call."""
+        return self.match(self.embed(face_img))
+
+
+_galleries = {}
+_galleries_lock = threading.Lock()
+
+
+def get_gallery(db_path, **kwargs):
+    """Return the process-wide gallery for db_path, loading it on first use."""
+    key = (os.path.abspath(db_path),) + tuple(sorted(kwargs.items()))
+    with _galleries_lock:
+        if key not in _galleries:
+            _galleries[key] = FaceGallery(db_path, **kwargs)
+        return _galleries[key]
@@ -0,0 +1,101 @@
+import base64
+import json
+from datetime import datetime
+
+from bson.objectid import ObjectId
+from pymongo import ASCENDING, DESCENDING
+
+# Recognized-face fields returned unless the image is asked for; the JPEG bytes dominate document size
+SUMMARY_PROJECTION = {"image": 0}
+
+MAX_PAGE_SIZE = 1000
+
+
+def encode_cursor(document):
+    """Opaque page token: the (timestamp, _id) sort key of the last document on a page."""
+    key = json.dumps([document["timestamp"].isoformat(), str(document["_id"])])
+    return base64.urlsafe_b64encode(key.encode()).decode()
+
+
+def decode_cursor(token):
+    try:
+        timestamp, object_id = json.loads(base64.urlsafe_b64decode(token.encode()).decode())
+        return datetime.fromisoformat(timestamp), ObjectId(object_id)
+    except Exception:
+        raise ValueError(f"Invalid cursor: {token}")
+
+
+class FaceQuery:
+    def __init__(self, collection):
+        """
+        Read side of the recognized-faces collection.
+        - Results come newest first, ordered by (timestamp, _id), which the indexes below cover,
+          so filtering and sorting never scan the whole collection.
+        - Pages are keyset-based: the cursor is the last (timestamp, _id) seen, so deep pages cost
+          the same as the first one (no skip()).
+        - Image bytes are left out unless include_image=True.
+        """
+        self.collection = collection
+
+    def ensure_indexes(self):
+        try:
+            self.collection.create_index([("name", ASCENDING), ("timestamp", DESCENDING), ("_id", DESCENDING)])
+            self.collection.create_index([("timestamp", DESCENDING), ("_id", DESCENDING)])
+        except Exception as e:
+            print(f"Error creating recognized-face indexes: {e}")
+
+    @staticmethod
+    def build_filter(name=None, start=None, end=None, camera=None):
+        """Mongo filter for a name, a [start, end) time range and a camera; all optional."""
+        query = {}
+        if name is not None:
+            query["name"] = name
+        if camera is not None:
+            query["camera"] = camera
+        if start is not None or end is not None:
+            query["timestamp"] = {}
+            if start is not None:
+                query["timestamp"]["$gte"] = start
+            if end is not None:
+                query["timestamp"]["$lt"] = end
+        return query
+
+    def _cursor(self, query, include_image):
+        projection = None if include_image else SUMMARY_PROJECTION
+        return self.collection.find(query, projection).sort([("timestamp", DESCENDING), ("_id", DESCENDING)])
+
+    def page(self, name=None, start=None, end=None, camera=None, limit=100, cursor=None, include_image=False):
+        """
+        One page of faces matching the filters.
+        Returns (documents, next_cursor); next_cursor is None on the last page.
+        """
+        limit = max(1, min(int(limit), MAX_PAGE_SIZE))
+        query = self.build_filter(name, start, end, camera)
+        if cursor is not None:
+            timestamp, object_id = decode_cursor(cursor)
+            # Strictly after the last document of the previous page, in (timestamp, _id) order
+            query["$or"] = [{"timestamp": {"$lt": timestamp}},
+                            {"timestamp": timestamp, "_id": {"$lt": object_id}}]
+
+        # One extra document tells whether another page follows
+        documents = list(self._cursor(query, include_image).limit(limit + 1))
+        if len(documents) <= limit:
+            return documents, None
+        documents = documents[:limit]
+        return documents, encode_cursor(documents[-1])
+
+    def export(self, name=None, start=None, end=None, camera=None, include_image=False, batch_size=1000):
+        """Stream every matching face, newest first, without holding the result set in memory."""
+        query = self.build_filter(name, start, end, camera)
+        for document in self._cursor(query, include_image).batch_size(batch_size):
+            yield document
+
+    def image(self, face_id):
+        """JPEG bytes of one face record, or None."""
+        document = self.collection.find_one({"_id": ObjectId(face_id)}, {"image": 1})
+        return document.get("image") if document else None
+
+    def clip(self, face_id):
+        """Path of the event clip linked from one face record, or None."""
+        document = self.collection.find_one({"_id": ObjectId(face_id)}, {"clip": 1})
+        return document.get("clip") if document else None
@@ -0,0 +1,101 @@
+import itertools
+
+
+def box_iou(a, b):
+    """Intersection over union of two (x, y, w, h) boxes."""
+    ax, ay, aw, ah = a
+    bx, by, bw, bh = b
+    inter_w = min(ax + aw, bx + bw) - max(ax, bx)
+    inter_h = min(ay + ah, by + bh) - max(ay, by)
+    if inter_w <= 0 or inter_h <= 0:
+        return 0.0
+    intersection = inter_w * inter_h
+    union = aw * ah + bw * bh - intersection
+    return intersection / union if union > 0 else 0.0
+
+
+class Track:
+    def __init__(self, track_id, box, frame_index):
+        self.track_id = track_id
+        self.box = box
+        self.name = None
+        self.distance = None
+        self.last_seen = frame_index
+        self.last_recognized = None
+
+
+class FaceTracker:
+    def __init__(self, iou_threshold=0.3, max_missed=10, reverify_interval=50):
+        """
+        Link face detections across frames and remember who each track is.
+        - Detections are matched to existing tracks greedily by IoU.
+        - A track is recognized when it first appears and then every `reverify_interval` frames.
+        - Tracks unseen for more than `max_missed` frames are dropped. When detection only searched
+          some regions of the frame, tracks lying outside all of them were not looked for and are
+          carried over instead of being counted as missed.
+        """
+        self.iou_threshold = iou_threshold
+        self.max_missed = max_missed
+        self.reverify_interval = reverify_interval
+        self.tracks = []
+        self.frame_index = 0
+        self._ids = itertools.count(1)
+
+    def update(self, boxes, regions=None):
+        """
+        Advance one frame with this frame's detections.
+        - `regions` are the (x, y, w, h) areas that were searched; None means the whole frame.
+        Returns one Track per box, in the same order as `boxes`.
+        """
+        self.frame_index += 1
+
+        candidates = []
+        for t, track in enumerate(self.tracks):
+            for b, box in enumerate(boxes):
+                iou = box_iou(track.box, box)
+                if iou >= self.iou_threshold:
+                    candidates.append((iou, t, b))
+        candidates.sort(reverse=True)
+
+        assigned = [None] * len(boxes)
+        used_tracks = set()
+        for _, t, b in candidates:
+            if t in used_tracks or assigned[b] is not None:
+                continue
+            track = self.tracks[t]
+            track.box = boxes[b]
+            track.last_seen = self.frame_index
+            assigned[b] = track
+            used_tracks.add(t)
+
+        if regions is not None:
+            for t, track in enumerate(self.tracks):
+                if t not in used_tracks and not any(box_iou(track.box, region) > 0 for region in regions):
+                    track.last_seen = self.frame_index  # Not searched this frame: still where it was
+
+        for b, box in enumerate(boxes):
+            if assigned[b] is None:
+                track = Track(next(self._ids), box, self.frame_index)
+                self.tracks.append(track)
+                assigned[b] = track
+
+        self.tracks = [track for track in self.tracks
+                       if self.frame_index - track.last_seen <= self.max_missed]
+        return assigned
+
+    def current(self):
+        """Tracks matched or carried over by the latest update: every face to draw on this frame."""
+        return [track for track in self.tracks if track.last_seen == self.frame_index]
+
+    def needs_recognition(self, track):
+        """True when a track has never been recognized or is due for re-verification."""
+        if track.last_recognized is None:
+            return True
+        return self.frame_index - track.last_recognized >= self.reverify_interval
+
+    def set_identity(self, track, name, distance=None):
+        """Record a recognition result; a failed re-verification keeps the previous label."""
+        if distance is not None or track.name is None:
+            track.name = name
+            track.distance = distance
+        track.last_recognized = self.frame_index
@@ -0,0 +1,43 @@
+import threading
+import time
+
+
+class LatestFrameBuffer:
+    def __init__(self):
+        """
+        Single-slot hand-off between a capture thread and a processing loop.
+        - put() overwrites any frame that has not been consumed yet, so the consumer
+          always works on the newest frame and skips as many as its processing time requires.
+        - get() blocks until a frame arrives instead of polling.
+        """
+        self.condition = threading.Condition()
+        self.frame = None
+        self.frame_time = None
+        self.timestamp = None  # Capture time (time.monotonic) of the frame last returned by get()
+        self.captured = 0
+        self.dropped = 0
+        self.closed = False
+
+    def put(self, frame):
+        with self.condition:
+            if self.frame is not None:
+                self.dropped += 1
+            self.frame = frame
+            self.frame_time = time.monotonic()
+            self.captured += 1
+            self.condition.notify()
+
+    def get(self, timeout=None):
+        """Return the newest unconsumed frame, or None on timeout or once the buffer is closed."""
+        with self.condition:
+            self.condition.wait_for(lambda: self.frame is not None or self.closed, timeout)
+            frame, self.frame = self.frame, None
+            if frame is not None:
+                self.timestamp = self.frame_time
+            return frame
+
+    def close(self):
+        """Wake the consumer for good; called when capture stops."""
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
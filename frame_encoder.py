@@ -0,0 +1,69 @@
+import threading
+import time
+
+import cv2
+
+# Output profiles viewers can pick with ?profile=<name> on the /video_feedN routes
+PROFILES = {
+    "full": {"width": None, "quality": 80},   # Single full-resolution view
+    "tile": {"width": 480, "quality": 70},    # Tile in the multi-camera grid
+    "thumb": {"width": 240, "quality": 60},   # Thumbnail
+}
+DEFAULT_PROFILE = "full"
+
+
+def multipart_chunk(jpeg_bytes):
+    """Wrap one JPEG as a part of a multipart/x-mixed-replace stream."""
+    return (b'--frame\r\n'
+            b'Content-Type: image/jpeg\r\n\r\n' + jpeg_bytes + b'\r\n')
+
+
+def encode_frame(frame, profile=DEFAULT_PROFILE):
+    """Scale a frame down to the profile's width (keeping aspect ratio) and encode it as JPEG."""
+    settings = PROFILES[profile]
+    width = settings["width"]
+    if width is not None and frame.shape[1] > width:
+        height = int(round(frame.shape[0] * width / frame.shape[1]))
+        frame = cv2.resize(frame, (width, height), interpolation=cv2.INTER_AREA)
+
+    ok, buffer = cv2.imencode('.jpg', frame, [int(cv2.IMWRITE_JPEG_QUALITY), settings["quality"]])
+    if not ok:
+        raise ValueError("Could not encode frame.")
+    return buffer.tobytes()
+
+
+class EncodedFrame:
+    def __init__(self, frame, timer=None):
+        """
+        An annotated frame plus its encoded multipart chunks.
+        - Each profile is encoded at most once, by whichever viewer asks for it first;
+          every other viewer of that profile reuses the cached chunk.
+        """
+        self.frame = frame
+        self.timer = timer
+        self.lock = threading.Lock()
+        self.jpegs = {}
+        self.chunks = {}
+
+    def jpeg(self, profile=DEFAULT_PROFILE):
+        """The frame's JPEG bytes in a profile, encoded on first use."""
+        with self.lock:
+            return self._jpeg(profile)
+
+    def _jpeg(self, profile):
+        jpeg = self.jpegs.get(profile)
+        if jpeg is None:
+            start = time.perf_counter()
+            jpeg = encode_frame(self.frame, profile)
+            if self.timer is not None:
+                self.timer.observe("encode", time.perf_counter() - start)
+            self.jpegs[profile] = jpeg
+        return jpeg
+
+    def chunk(self, profile=DEFAULT_PROFILE):
+        with self.lock:
+            chunk = self.chunks.get(profile)
+            if chunk is None:
+                chunk = multipart_chunk(self._jpeg(profile))
+                self.chunks[profile] = chunk
+            return chunk
@@ -0,0 +1,125 @@
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import numpy as np
+
+import metrics
+from model_registry import models
+
+BATCH_SIZE = metrics.REGISTRY.histogram(
+    "inference_batch_size", "Faces embedded per recognition forward pass.", (),
+    buckets=(1, 2, 4, 8, 16, 32, 64))
+
+
+class InferenceService:
+    def __init__(self, gallery, detector_backend="opencv", detect_workers=None,
+                 batch_size=16, max_batch_wait=0.01):
+        """
+        Shared detection and recognition for every camera pipeline.
+        - Face detection runs on a thread pool sized to the machine's cores
+          (OpenCV and TensorFlow release the GIL while they work).
+        - Face crops from all cameras are collected by one batching thread and embedded
+          in a single forward pass, up to `batch_size` faces or `max_batch_wait` seconds.
+        - Every call returns a Future, so each result goes back to the pipeline that asked.
+        """
+        self.gallery = gallery
+        self.detector_backend = detector_backend
+        self.batch_size = batch_size
+        self.max_batch_wait = max_batch_wait
+
+        self.detect_pool = ThreadPoolExecutor(max_workers=detect_workers or os.cpu_count() or 1,
+                                              thread_name_prefix="face-detect")
+        self.requests = queue.Queue()
+        self.stop_event = threading.Event()
+        self.batch_thread = threading.Thread(target=self._batch_loop, daemon=True)
+        self.batch_thread.start()
+
+        metrics.REGISTRY.callback("inference_queue_depth", "Face crops waiting for recognition.",
+                                  (), lambda: [({}, self.requests.qsize())])
+
+    def detect(self, frame):
+        """Submit a frame for face detection; the Future resolves to DeepFace.extract_faces output."""
+        return self.detect_pool.submit(models.deepface().extract_faces, frame,
+                                       detector_backend=self.detector_backend, enforce_detection=False)
+
+    def detect_boxes(self, frame, regions=None):
+        """
+        Detect faces in (x, y, w, h) regions of a frame, or in the whole frame by default.
+        - Regions are detected in parallel; boxes come back in frame coordinates.
+        - DeepFace reports "no face" as one face covering its whole input, which is dropped here.
+        """
+        height, width = frame.shape[:2]
+        regions = regions or [(0, 0, width, height)]
+        futures = [(x, y, w, h, self.detect(np.ascontiguousarray(frame[y:y + h, x:x + w])))
+                   for x, y, w, h in regions]
+
+        boxes = []
+        for x, y, w, h, future in futures:
+            for face in future.result():
+                area = face["facial_area"]
+                if (area["x"], area["y"], area["w"], area["h"]) == (0, 0, w, h):
+                    continue
+                boxes.append((x + area["x"], y + area["y"], area["w"], area["h"]))
+        return boxes
+
+    def identify(self, cropped_face):
+        """Submit a cropped face for recognition; the Future resolves to (identity, distance)."""
+        future = Future()
+        self.requests.put((cropped_face, future))
+        return future
+
+    def _next_batch(self):
+        """Block for the first request, then gather more until the batch is full or the wait expires."""
+        try:
+            batch = [self.requests.get(timeout=0.5)]
+        except queue.Empty:
+            return []
+
+        deadline = time.monotonic() + self.max_batch_wait
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self.requests.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _batch_loop(self):
+        while not self.stop_event.is_set():
+            batch = self._next_batch()
+            if not batch:
+                continue
+
+            batch = [(face, future) for face, future in batch if future.set_running_or_notify_cancel()]
+            BATCH_SIZE.observe(len(batch))
+            try:
+                results = self.gallery.identify_batch([face for face, _ in batch])
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+
+            for (_, future), result in zip(batch, results):
+                future.set_result(result)
+
+    def shutdown(self):
+        self.stop_event.set()
+        self.batch_thread.join()
+        self.detect_pool.shutdown(wait=True)
+
+
+_services = {}
+_services_lock = threading.Lock()
+
+
+def get_inference_service(gallery, **kwargs):
+    """Return the process-wide inference service for a gallery, starting it on first use."""
+    with _services_lock:
+        if id(gallery) not in _services:
+            _services[id(gallery)] = InferenceService(gallery, **kwargs)
+        return _services[id(gallery)]
@@ -0,0 +1,297 @@
+"""
+HTTP load test for the streaming and authentication endpoints.
+
+Starts main.py against generated (synthetic://) cameras and the in-memory MongoDB
+stand-in, then opens concurrent MJPEG viewers on the /video_feedN routes while
+flooding /create_account and /login, and prints a JSON report: delivered FPS per
+viewer, time to first frame, request latency percentiles and server CPU/memory.
+
+    python loadtest.py --viewers 40 --duration 60
+    python loadtest.py --viewers 200 --server async --pipeline livecam
+    python loadtest.py --url http://camera-server:5000 --viewers 20 --accounts 0 --logins 0
+"""
+import argparse
+import http.client
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlencode, urlsplit
+
+from benchmark import synthetic_source
+from camera_registry import DEFAULT_CAMERAS
+from face_gallery import DEFAULT_DB_PATH
+from frame_encoder import DEFAULT_PROFILE, PROFILES
+from stage_timer import summarize
+
+BOUNDARY = b"--frame\r\n"
+
+
+def write_camera_config(path, db_path, pipeline, width, height, fps):
+    """Camera config with the default feed ids, each reading generated frames."""
+    cameras = []
+    for camera in DEFAULT_CAMERAS:
+        cameras.append({
+            "id": camera["id"],
+            "source": synthetic_source(db_path, width=width, height=height, fps=fps),
+            "pipeline": pipeline or camera["pipeline"],
+            "clips": False,  # Keep clip writing out of the measurements
+        })
+    with open(path, "w") as f:
+        json.dump({"cameras": cameras}, f)
+
+
+def start_server(port, camera_config, server):
+    env = dict(os.environ, MONGO_URI="memory://", CAMERAS_CONFIG=camera_config, PORT=str(port),
+               FLASK_DEBUG="0", STREAM_SERVER=server)
+    here = os.path.dirname(os.path.abspath(__file__))
+    return subprocess.Popen([sys.executable, os.path.join(here, "main.py")], cwd=here, env=env)
+
+
+def wait_until_up(host, port, timeout):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            connection = http.client.HTTPConnection(host, port, timeout=2)
+            connection.request("GET", "/login")
+            connection.getresponse().read()
+            connection.close()
+            return True
+        except OSError:
+            time.sleep(0.5)
+    return False
+
+
+class ProcessSampler:
+    def __init__(self, pid, interval=0.5):
+        """Sample a process's CPU share and resident memory from /proc until stopped (Linux)."""
+        self.pid = pid
+        self.interval = interval
+        self.cpu = []
+        self.rss = []
+        self.stop_event = threading.Event()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+
+    def _cpu_seconds(self):
+        with open(f"/proc/{self.pid}/stat") as f:
+            fields = f.read().rsplit(")", 1)[1].split()
+        return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+
+    def _rss_bytes(self):
+        with open(f"/proc/{self.pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+        return 0
+
+    def _run(self):
+        try:
+            last_cpu, last_time = self._cpu_seconds(), time.monotonic()
+            while not self.stop_event.wait(self.interval):
+                cpu, now = self._cpu_seconds(), time.monotonic()
+                self.cpu.append(100.0 * (cpu - last_cpu) / (now - last_time))
+                self.rss.append(self._rss_bytes())
+                last_cpu, last_time = cpu, now
+        except OSError:
+            pass  # No /proc (not Linux) or the server exited
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+        self.thread.join()
+        if not self.cpu:
+            return None
+        return {
+            "cpu_percent_mean": round(sum(self.cpu) / len(self.cpu), 1),
+            "cpu_percent_max": round(max(self.cpu), 1),
+            "rss_mb_max": round(max(self.rss) / 2 ** 20, 1),
+        }
+
+
+def watch_stream(host, port, path, duration, results):
+    """
+    One MJPEG viewer: count frames until `duration` seconds after the first one.
+    Appends {"path", "ttff_s", "frames", "fps", "error"} to results.
+    """
+    result = {"path": path, "ttff_s": None, "frames": 0, "fps": 0.0, "error": None}
+    started = time.monotonic()
+    first_frame = None
+    try:
+        connection = http.client.HTTPConnection(host, port, timeout=30)
+        connection.request("GET", path)
+        response = connection.getresponse()
+        if response.status != 200:
+            raise RuntimeError(f"HTTP {response.status}")
+        tail = b""
+        while True:
+            data = response.read1(65536)
+            if not data:
+                break
+            now = time.monotonic()
+            # Keep the end of the last read so a boundary split across reads still counts
+            combined = tail + data
+            count = combined.count(BOUNDARY)
+            tail = combined[-(len(BOUNDARY) - 1):]
+            if count and first_frame is None:
+                first_frame = now
+                result["ttff_s"] = now - started
+            result["frames"] += count
+            if first_frame is not None and now - first_frame >= duration:
+                break
+        connection.close()
+    except Exception as e:
+        result["error"] = str(e)
+    if first_frame is not None:
+        elapsed = time.monotonic() - first_frame
+        result["fps"] = round(max(0, result["frames"] - 1) / elapsed, 2) if elapsed > 0 else 0.0
+    results.append(result)
+
+
+def post_form(host, port, path, fields):
+    """POST a form without following redirects; returns (status, seconds)."""
+    body = urlencode(fields)
+    started = time.monotonic()
+    connection = http.client.HTTPConnection(host, port, timeout=30)
+    try:
+        connection.request("POST", path, body, {"Content-Type": "application/x-www-form-urlencoded"})
+        response = connection.getresponse()
+        response.read()
+        return response.status, time.monotonic() - started
+    finally:
+        connection.close()
+
+
+def flood(host, port, path, forms, concurrency):
+    """Send every form to `path` from `concurrency` workers; returns latency summary and status counts."""
+    latencies = []
+    statuses = {}
+    lock = threading.Lock()
+
+    def send(fields):
+        try:
+            status, seconds = post_form(host, port, path, fields)
+        except Exception as e:
+            status, seconds = type(e).__name__, None
+        with lock:
+            statuses[str(status)] = statuses.get(str(status), 0) + 1
+            if seconds is not None:
+                latencies.append(seconds)
+
+    started = time.monotonic()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(send, forms))
+    elapsed = time.monotonic() - started
+    return {"requests": len(forms), "seconds": round(elapsed, 3),
+            "requests_per_s": round(len(forms) / elapsed, 1) if elapsed > 0 else 0.0,
+            "statuses": statuses, "latency": summarize(latencies)}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load-test the streaming and login endpoints.")
+    parser.add_argument("--url", help="Test a running server instead of starting one.")
+    parser.add_argument("--port", type=int, default=5055, help="Port for the server this tool starts.")
+    parser.add_argument("--server", default="flask", choices=("flask", "async"), help="STREAM_SERVER mode.")
+    parser.add_argument("--pipeline", choices=("camera", "camera3", "livecam"),
+                        help="Pipeline for every generated camera; defaults to each feed's usual one.")
+    parser.add_argument("--db-path", default=DEFAULT_DB_PATH, help="Known-face gallery (also the generated faces).")
+    parser.add_argument("--width", type=int, default=1280)
+    parser.add_argument("--height", type=int, default=720)
+    parser.add_argument("--fps", type=float, default=30, help="Frame rate of the generated cameras.")
+    parser.add_argument("--feeds", default=",".join(camera["id"] for camera in DEFAULT_CAMERAS),
+                        help="Comma-separated feed routes the viewers are spread over.")
+    parser.add_argument("--viewers", type=int, default=20, help="Concurrent MJPEG viewers.")
+    parser.add_argument("--profile", default=DEFAULT_PROFILE, choices=sorted(PROFILES))
+    parser.add_argument("--duration", type=float, default=30, help="Seconds each viewer watches after its first frame.")
+    parser.add_argument("--accounts", type=int, default=200, help="Accounts created in the create_account flood.")
+    parser.add_argument("--logins", type=int, default=1000, help="Requests in the login flood.")
+    parser.add_argument("--concurrency", type=int, default=20, help="Concurrent clients per flood.")
+    parser.add_argument("--startup-timeout", type=float, default=180)
+    parser.add_argument("--output", help="Write the JSON report here instead of stdout.")
+    args = parser.parse_args(argv)
+
+    server = None
+    sampler = None
+    config_dir = tempfile.TemporaryDirectory()
+    if args.url:
+        parts = urlsplit(args.url)
+        host, port = parts.hostname, parts.port or 80
+    else:
+        host, port = "127.0.0.1", args.port
+        camera_config = os.path.join(config_dir.name, "cameras.json")
+        write_camera_config(camera_config, args.db_path, args.pipeline, args.width, args.height, args.fps)
+        print(f"Starting the server on port {port}...", file=sys.stderr)
+        server = start_server(port, camera_config, args.server)
+
+    try:
+        if not wait_until_up(host, port, args.startup_timeout):
+            raise RuntimeError("The server did not come up in time.")
+        if server is not None:
+            sampler = ProcessSampler(server.pid)
+            sampler.start()
+
+        run_id = uuid.uuid4().hex[:8]
+        accounts = [{"username": f"load_{run_id}_{i}", "email": f"load_{run_id}_{i}@example.com",
+                     "password": "load-test-password"} for i in range(args.accounts)]
+        report = {"viewers": args.viewers, "profile": args.profile, "server": args.server}
+
+        print(f"Creating {len(accounts)} accounts...", file=sys.stderr)
+        report["create_account"] = flood(host, port, "/create_account", accounts, args.concurrency)
+
+        # Viewers and the login flood run together, as they would in production
+        feeds = [feed.strip() for feed in args.feeds.split(",") if feed.strip()]
+        viewers = []
+        results = []
+        for i in range(args.viewers):
+            path = f"/{feeds[i % len(feeds)]}?profile={args.profile}"
+            thread = threading.Thread(target=watch_stream, args=(host, port, path, args.duration, results),
+                                      daemon=True)
+            thread.start()
+            viewers.append(thread)
+
+        if accounts and args.logins:
+            print(f"Sending {args.logins} logins while {args.viewers} viewers watch...", file=sys.stderr)
+            logins = [{"username": accounts[i % len(accounts)]["username"], "password": "load-test-password"}
+                      for i in range(args.logins)]
+            report["login"] = flood(host, port, "/login", logins, args.concurrency)
+
+        for thread in viewers:
+            thread.join(args.duration + args.startup_timeout)
+
+        delivered = [result["fps"] for result in results if result["error"] is None]
+        report["streams"] = {
+            "connected": len(delivered),
+            "errors": len(results) - len(delivered),
+            "fps_per_viewer": {"min": min(delivered, default=0.0),
+                               "mean": round(sum(delivered) / len(delivered), 2) if delivered else 0.0,
+                               "max": max(delivered, default=0.0)},
+            "time_to_first_frame": summarize([r["ttff_s"] for r in results if r["ttff_s"] is not None]),
+            "per_viewer": results,
+        }
+        if sampler is not None:
+            report["server_resources"] = sampler.stop()
+    finally:
+        if server is not None:
+            server.terminate()
+            try:
+                server.wait(10)
+            except subprocess.TimeoutExpired:
+                server.kill()
+        config_dir.cleanup()
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
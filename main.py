@@ -1,22 +1,57 @@
-from flask import Flask, render_template, request, redirect, flash, jsonify, url_for, session, Response
+import atexit
+import base64
+import json
+import os
+from datetime import datetime
+from flask import Flask, render_template, request, redirect, flash, jsonify, url_for, session, Response, abort, send_file
 from werkzeug.security import generate_password_hash, check_password_hash
 from bson import ObjectId
 from database import AuthenticationDB
-from camera import CameraFeed
-from camera2 import LiveCam
-from camera3 import CameraFeed3
 from face_database_handler import FaceDatabaseHandler
+from camera_registry import CameraBusy, CameraRegistry
+from clip_recorder import close_clip_writer
+from frame_encoder import PROFILES, DEFAULT_PROFILE
+import metrics
+from model_registry import models
+from face_gallery import DEFAULT_DB_PATH
 
-auth_db = AuthenticationDB()
+# MONGO_URI=memory:// runs against the in-process stand-in (load tests, demos without MongoDB)
+MONGO_URI = os.environ.get('MONGO_URI', 'mongodb://localhost:27017/')
+
+# Debug mode also runs werkzeug's reloader (FLASK_DEBUG=0 to turn both off)
+FLASK_DEBUG = os.environ.get('FLASK_DEBUG', '1') != '0'
+
+auth_db = AuthenticationDB(db_uri=MONGO_URI)
 db_handler = FaceDatabaseHandler(
-        db_uri="mongodb://localhost:27017",
+        db_uri=MONGO_URI,
         db_name="face_recognition_db",
-        collection_name="recognized_faces"
+        collection_name="recognized_faces",
+        buffered=True,
+        sighting_window=30  # Collapse repeated detections of a person into one record
     )
+atexit.register(db_handler.close)  # Flush buffered face records on shutdown
+
+atexit.register(close_clip_writer)  # Runs after the cameras stop, so their last clips are written
+
+# Configured cameras (CAMERAS_CONFIG=cameras.json to override the built-in four), started on demand.
+# Event clips are recorded for cameras whose entry sets "clips": true.
+camera_registry = CameraRegistry.from_config(os.environ.get('CAMERAS_CONFIG'), db_handler=db_handler)
+atexit.register(camera_registry.shutdown)
 
 app = Flask(__name__)
 app.secret_key = 'your_secret_key'
 
+def is_serving_process():
+    """False only in the reloader's watcher process, which restarts the server but never serves requests."""
+    if __name__ != '__main__' or os.environ.get('STREAM_SERVER') == 'async' or not FLASK_DEBUG:
+        return True
+    return os.environ.get('WERKZEUG_RUN_MAIN') == 'true'
+
+# Build and warm up the recognition models in the background (PRELOAD_MODELS=0 for live-only setups)
+if os.environ.get('PRELOAD_MODELS', '1') != '0' and is_serving_process():
+    models.preload_async(db_path=DEFAULT_DB_PATH,
+                         watch_interval=float(os.environ.get('GALLERY_WATCH_INTERVAL', '60')))
+
 @app.route('/')
 def home():
     if 'user_id' in session:
@@ -64,6 +99,8 @@ def login():
         if user and check_password_hash(user['password_hash'], password):
             flash('Login successful!', 'success')
             session['user_id'] = str(user['_id']) if '_id' in user else username
+            if '_id' in user:
+                auth_db.cache_user(user)  # The next page load reads it from the cache
             return redirect(url_for('camera_streaming'))
         else:
             flash('Invalid username or password.', 'error')
@@ -81,6 +118,8 @@ def admin_login():
         if user and check_password_hash(user['password_hash'], password):
             flash('Login successful!', 'success')
             session['user_id'] = str(user['_id']) if '_id' in user else username
+            if '_id' in user:
+                auth_db.cache_user(user)  # The next page load reads it from the cache
             return render_template('user_manage.html')
         else:
             flash('Invalid username or password.', 'error')
@@ -102,37 +141,151 @@ def camera_streaming():
 
     return render_template('camera_streaming2.html')
 
+def stream_profile():
+    """Output profile requested with ?profile=, e.g. 'tile' for the grid page."""
+    profile = request.args.get('profile', DEFAULT_PROFILE)
+    if profile not in PROFILES:
+        abort(400, f"Unknown profile: {profile}")
+    return profile
+
+def video_response(camera_id):
+    profile = stream_profile()
+    try:
+        frames = camera_registry.stream(camera_id, profile)
+        return Response(frames, mimetype='multipart/x-mixed-replace; boundary=frame')
+    except KeyError:
+        abort(404)
+    except CameraBusy as e:
+        return str(e), 503
+    except Exception as e:
+        return f"Error: {str(e)}", 500
+
 @app.route('/video_feed0')
 def video_feed0():
-    camera_feed0 = CameraFeed('')
-    return Response(camera_feed0.generate_frames(), mimetype='multipart/x-mixed-replace; boundary=frame')
+    return video_response('video_feed0')
 
 @app.route('/video_feed1')
 def video_feed1():
-    try:
-        camera_feed1 = LiveCam('https://192.168.1.210:8080/video')
-        return Response(camera_feed1.LiveCamFeed(), mimetype='multipart/x-mixed-replace; boundary=frame')
-    except Exception as e:
-        return f"Error: {str(e)}", 500
+    return video_response('video_feed1')
 
 @app.route('/video_feed2')
 def video_feed2():
-    camera_feed2 = CameraFeed(url='https://192:8080/video', db_handler=db_handler)
-    return Response(camera_feed2.generate_frames(), mimetype='multipart/x-mixed-replace; boundary=frame')
+    return video_response('video_feed2')
 
 @app.route('/video_feed3')
 def video_feed3():
+    return video_response('video_feed3')
+
+@app.route('/api/faces/<face_id>/clip')
+def api_face_clip(face_id):
+    """The event video recorded around a face, once the background writer has finished it."""
+    if api_user() is None:
+        return jsonify({'error': 'Login required.'}), 401
+    if not ObjectId.is_valid(face_id):
+        abort(404)
+    clip = db_handler.query.clip(face_id)
+    if clip is None or not os.path.isfile(clip):
+        abort(404)
+    return send_file(clip, mimetype='video/x-msvideo')
+
+@app.route('/cameras/<camera_id>/feed')
+def camera_feed(camera_id):
+    """Any camera from the registry, including ones beyond the four on the camera page."""
+    return video_response(camera_id)
+
+@app.route('/api/cameras')
+def api_cameras():
+    if api_user() is None:
+        return jsonify({'error': 'Login required.'}), 401
+    return jsonify({'cameras': camera_registry.status()})
+
+def api_user():
+    """The logged-in user for the JSON API, or None."""
+    user_id = session.get('user_id')
+    if user_id is None:
+        return None
+    return auth_db.get_user_by_id(ObjectId(user_id)) if ObjectId.is_valid(user_id) else auth_db.get_user_by_username(user_id)
+
+def face_filters():
+    """name/camera/start/end query parameters; start and end are ISO 8601 times."""
     try:
-        camera_feed3 = CameraFeed3(0, db_handler)
-        return Response(camera_feed3.generate_frames(), mimetype='multipart/x-mixed-replace; boundary=frame')
-    except Exception as e:
-        return f"Error: {str(e)}", 500
+        start = request.args.get('start')
+        end = request.args.get('end')
+        return {
+            'name': request.args.get('name'),
+            'camera': request.args.get('camera'),
+            'start': datetime.fromisoformat(start) if start else None,
+            'end': datetime.fromisoformat(end) if end else None,
+        }
+    except ValueError as e:
+        abort(400, str(e))
+
+def face_json(document):
+    face = {key: value for key, value in document.items() if key != 'image'}
+    face['_id'] = str(face['_id'])
+    for key, value in face.items():
+        if isinstance(value, datetime):
+            face[key] = value.isoformat()
+    if 'image' in document:
+        face['image'] = base64.b64encode(document['image']).decode()
+    return face
+
+@app.route('/api/faces')
+def api_faces():
+    """One page of recognized faces, newest first; pass next_cursor back as ?cursor= for the next."""
+    if api_user() is None:
+        return jsonify({'error': 'Login required.'}), 401
+    try:
+        faces, next_cursor = db_handler.query.page(
+            limit=request.args.get('limit', 100, type=int), cursor=request.args.get('cursor'),
+            include_image=request.args.get('include_image') == '1', **face_filters())
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify({'faces': [face_json(face) for face in faces], 'next_cursor': next_cursor})
+
+@app.route('/api/faces/export')
+def api_faces_export():
+    """Every matching face as newline-delimited JSON, streamed straight from the database cursor."""
+    if api_user() is None:
+        return jsonify({'error': 'Login required.'}), 401
+    faces = db_handler.query.export(include_image=request.args.get('include_image') == '1', **face_filters())
+    lines = (json.dumps(face_json(face)) + '\n' for face in faces)
+    return Response(lines, mimetype='application/x-ndjson',
+                    headers={'Content-Disposition': 'attachment; filename=faces.ndjson'})
+
+@app.route('/api/faces/<face_id>/image')
+def api_face_image(face_id):
+    if api_user() is None:
+        return jsonify({'error': 'Login required.'}), 401
+    if not ObjectId.is_valid(face_id):
+        abort(404)
+    image = db_handler.query.image(face_id)
+    if image is None:
+        abort(404)
+    return Response(image, mimetype='image/jpeg')
+
+@app.route('/metrics')
+def metrics_endpoint():
+    return Response(metrics.REGISTRY.render(), mimetype=metrics.CONTENT_TYPE)
 
 @app.route('/logout')
 def logout():
-    session.pop('user_id', None)
+    user_id = session.pop('user_id', None)
+    if user_id is not None:
+        auth_db.invalidate_user(user_id)
     flash('You have been logged out.', 'success')
     return redirect(url_for('home'))
 
 if __name__ == '__main__':
-    app.run(debug=True)
+    if os.environ.get('STREAM_SERVER') == 'async':
+        # Video feeds on an event loop, everything else through Flask on a thread pool
+        from async_stream import serve
+        routes = {}
+        for camera_id in camera_registry.cameras:
+            routes['/' + camera_id] = camera_id
+            routes[f'/cameras/{camera_id}/feed'] = camera_id
+        serve(app, camera_registry, routes,
+              host=os.environ.get('HOST', '127.0.0.1'), port=int(os.environ.get('PORT', '5000')))
+    else:
+        app.run(debug=FLASK_DEBUG, threaded=True,
+                host=os.environ.get('HOST', '127.0.0.1'), port=int(os.environ.get('PORT', '5000')))
@@ -0,0 +1,170 @@
+import copy
+import threading
+
+from bson.objectid import ObjectId
+
+MEMORY_SCHEME = "memory://"
+
+
+class InsertOneResult:
+    def __init__(self, inserted_id):
+        self.inserted_id = inserted_id
+
+
+class InMemoryCollection:
+    def __init__(self, name):
+        """
+        Minimal thread-safe stand-in for a pymongo Collection, for benchmarks and load tests.
+        - Filters support plain equality plus $gte/$gt/$lte/$lt/$in on top-level fields, and $or.
+        - find() returns a cursor with sort(), limit() and batch_size(), like pymongo's.
+        """
+        self.name = name
+        self.lock = threading.Lock()
+        self.documents = []
+
+    def insert_one(self, document):
+        document.setdefault("_id", ObjectId())
+        with self.lock:
+            self.documents.append(copy.copy(document))
+        return InsertOneResult(document["_id"])
+
+    def insert_many(self, documents, ordered=True):
+        for document in documents:
+            self.insert_one(document)
+
+    def update_one(self, filter, update, upsert=False):
+        with self.lock:
+            for document in self.documents:
+                if _matches(document, filter):
+                    _apply_update(document, update)
+                    return
+            if upsert:
+                document = {key: value for key, value in filter.items() if not isinstance(value, dict)}
+                document.setdefault("_id", ObjectId())
+                document.update(update.get("$setOnInsert", {}))
+                _apply_update(document, update)
+                self.documents.append(document)
+
+    def bulk_write(self, operations, ordered=True):
+        """Apply ("insert", document) and ("update", filter, update, upsert) tuples, as mongo_client.bulk_write passes them."""
+        for operation in operations:
+            kind = operation[0]
+            if kind == "insert":
+                self.insert_one(operation[1])
+            elif kind == "update":
+                _, filter, update, upsert = operation
+                self.update_one(filter, update, upsert=upsert)
+            else:
+                raise TypeError(f"Unsupported bulk operation: {kind!r}")
+
+    def find_one(self, filter=None, projection=None):
+        for document in self.find(filter, projection):
+            return document
+        return None
+
+    def find(self, filter=None, projection=None):
+        with self.lock:
+            matches = [document for document in self.documents if _matches(document, filter or {})]
+        return InMemoryCursor(matches, projection)
+
+    def count_documents(self, filter):
+        return len(self.find(filter))
+
+    def create_index(self, keys, **kwargs):
+        return "_".join(str(key) for key in (keys if isinstance(keys, str) else [k for k, _ in keys]))
+
+
+class InMemoryCursor:
+    def __init__(self, documents, projection=None):
+        self.documents = documents
+        self.projection = projection
+        self.limit_count = 0
+
+    def sort(self, key_or_list, direction=None):
+        keys = [(key_or_list, direction or 1)] if isinstance(key_or_list, str) else list(key_or_list)
+        for field, order in reversed(keys):  # Stable sorts, least significant key first
+            self.documents.sort(key=lambda document: document.get(field), reverse=order < 0)
+        return self
+
+    def limit(self, count):
+        self.limit_count = count
+        return self
+
+    def batch_size(self, size):
+        return self
+
+    def __iter__(self):
+        documents = self.documents[:self.limit_count] if self.limit_count else self.documents
+        return (_project(document, self.projection) for document in documents)
+
+    def __len__(self):
+        return len(self.documents[:self.limit_count] if self.limit_count else self.documents)
+
+
+class InMemoryDatabase:
+    def __init__(self, name):
+        self.name = name
+        self.lock = threading.Lock()
+        self.collections = {}
+
+    def __getitem__(self, name):
+        with self.lock:
+            if name not in self.collections:
+                self.collections[name] = InMemoryCollection(name)
+            return self.collections[name]
+
+
+class InMemoryMongoClient:
+    def __init__(self, *args, **kwargs):
+        self.lock = threading.Lock()
+        self.databases = {}
+
+    def __getitem__(self, name):
+        with self.lock:
+            if name not in self.databases:
+                self.databases[name] = InMemoryDatabase(name)
+            return self.databases[name]
+
+    def close(self):
+        pass
+
+
+def _matches(document, filter):
+    for field, condition in filter.items():
+        if field == "$or":
+            if not any(_matches(document, branch) for branch in condition):
+                return False
+            continue
+        value = document.get(field)
+        if isinstance(condition, dict):
+            for operator, operand in condition.items():
+                if operator == "$gte" and not (value is not None and value >= operand):
+                    return False
+                if operator == "$gt" and not (value is not None and value > operand):
+                    return False
+                if operator == "$lte" and not (value is not None and value <= operand):
+                    return False
+                if operator == "$lt" and not (value is not None and value < operand):
+                    return False
+                if operator == "$in" and value not in operand:
+                    return False
+        elif value != condition:
+            return False
+    return True
+
+
+def _apply_update(document, update):
+    for field, value in update.get("$set", {}).items():
+        document[field] = value
+    for field, value in update.get("$inc", {}).items():
+        document[field] = document.get(field, 0) + value
+
+
+def _project(document, projection):
+    if not projection:
+        return copy.copy(document)
+    excluded = {field for field, keep in projection.items() if not keep}
+    included = {field for field, keep in projection.items() if keep}
+    if included:
+        return {field: document[field] for field in included | {"_id"} - excluded if field in document}
+    return {field: value for field, value in document.items() if field not in excluded}
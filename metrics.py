@@ -0,0 +1,232 @@
+import threading
+import time
+import weakref
+from contextlib import contextmanager
+
+from stage_timer import NullStageTimer
+
+# Latency buckets (seconds) for the camera hot path: sub-millisecond encodes up to multi-second stalls
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _format_labels(labelnames, labelvalues, extra=()):
+    pairs = list(zip(labelnames, labelvalues)) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+               for _, value in pairs)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.lock = threading.Lock()
+
+    def _key(self, labels):
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def header(self):
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name, documentation, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        self.values = {}
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def render(self):
+        with self.lock:
+            values = dict(self.values)
+        return self.header() + [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+                                for key, value in sorted(values.items())]
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def set(self, value, **labels):
+        with self.lock:
+            self.values[self._key(labels)] = value
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+
+class CallbackGauge(_Metric):
+    def __init__(self, name, documentation, labelnames, callback, kind="gauge"):
+        """
+        A metric read at scrape time.
+        - `callback()` returns an iterable of (labels dict, value); sources that have gone away
+          simply stop appearing.
+        """
+        super().__init__(name, documentation, labelnames)
+        self.callback = callback
+        self.kind = kind
+
+    def render(self):
+        lines = self.header()
+        try:
+            samples = list(self.callback())
+        except Exception as e:
+            print(f"Error collecting metric {self.name}: {e}")
+            samples = []
+        for labels, value in samples:
+            lines.append(f"{self.name}{_format_labels(self.labelnames, self._key(labels))} {_format_value(value)}")
+        return lines
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self.series = {}
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self.lock:
+            series = self.series.get(key)
+            if series is None:
+                series = self.series[key] = {"counts": [0] * len(self.buckets), "sum": 0.0, "count": 0}
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series["counts"][i] += 1
+                    break
+            series["sum"] += value
+            series["count"] += 1
+
+    def render(self):
+        with self.lock:
+            series = {key: {"counts": list(s["counts"]), "sum": s["sum"], "count": s["count"]}
+                      for key, s in self.series.items()}
+        lines = self.header()
+        for key, s in sorted(series.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets, s["counts"]):
+                cumulative += count
+                labels = _format_labels(self.labelnames, key, [("le", _format_value(float(bound)))])
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labelnames, key, [("le", "+Inf")])
+            lines.append(f"{self.name}_bucket{labels} {s['count']}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {_format_value(s['sum'])}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {s['count']}")
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.metrics = {}
+
+    def _register(self, metric):
+        with self.lock:
+            if metric.name in self.metrics:
+                return self.metrics[metric.name]
+            self.metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self._register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name, documentation, labelnames=()):
+        return self._register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def callback(self, name, documentation, labelnames, callback, kind="gauge"):
+        """Register a scrape-time metric; re-registering a name replaces its callback."""
+        metric = CallbackGauge(name, documentation, labelnames, callback, kind)
+        with self.lock:
+            self.metrics[name] = metric
+        return metric
+
+    def render(self):
+        """All metrics in the Prometheus text exposition format."""
+        with self.lock:
+            metrics = [self.metrics[name] for name in sorted(self.metrics)]
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+STAGE_SECONDS = REGISTRY.histogram(
+    "camera_stage_seconds", "Time spent in each camera pipeline stage.", ("camera", "stage"))
+
+
+class MetricsStageTimer(NullStageTimer):
+    def __init__(self, camera):
+        """Stage timer that feeds camera_stage_seconds for one camera."""
+        self.camera = camera
+
+    @contextmanager
+    def time(self, stage):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - start)
+
+    def observe(self, stage, seconds):
+        STAGE_SECONDS.observe(seconds, camera=self.camera, stage=stage)
+
+
+def stage_timer(camera):
+    return MetricsStageTimer(str(camera))
+
+
+_pipelines = {}
+_pipelines_lock = threading.Lock()
+
+
+def register_pipeline(camera, feed):
+    """Expose a pipeline's frame-buffer and motion-gate counters until it is garbage collected."""
+    with _pipelines_lock:
+        _pipelines[str(camera)] = weakref.ref(feed)
+
+
+def _pipeline_samples(attribute):
+    with _pipelines_lock:
+        pipelines = list(_pipelines.items())
+    for camera, ref in pipelines:
+        feed = ref()
+        if feed is None:
+            with _pipelines_lock:
+                if _pipelines.get(camera) is ref:
+                    del _pipelines[camera]
+            continue
+        yield {"camera": camera}, attribute(feed)
+
+
+REGISTRY.callback("camera_frame_buffer_depth", "Frames captured but not yet processed (0 or 1).",
+                  ("camera",), lambda: _pipeline_samples(lambda feed: int(feed.frame_buffer.frame is not None)))
+REGISTRY.callback("camera_frames_captured_total", "Frames read from the camera.",
+                  ("camera",), lambda: _pipeline_samples(lambda feed: feed.frame_buffer.captured), kind="counter")
+REGISTRY.callback("camera_frames_dropped_total", "Captured frames overwritten before processing.",
+                  ("camera",), lambda: _pipeline_samples(lambda feed: feed.frame_buffer.dropped), kind="counter")
+REGISTRY.callback("camera_frames_motion_skipped_total", "Frames where no motion was seen and detection was skipped.",
+                  ("camera",), lambda: _pipeline_samples(lambda feed: feed.motion_gate.skipped), kind="counter")
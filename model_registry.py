@@ -0,0 +1,73 @@
+import threading
+import time
+
+import numpy as np
+
+
+class ModelRegistry:
+    def __init__(self):
+        """
+        Process-wide owner of the DeepFace models.
+        - deepface (and TensorFlow with it) is imported on first use only, so routes and
+          tools that never recognize faces do not pay for it.
+        - preload() builds the detector and recognizer once and runs a warm-up inference,
+          so the first frame of every feed does not stall on model construction.
+        """
+        self.lock = threading.Lock()
+        self.deepface_module = None
+        self.warmed_up = set()
+
+    def deepface(self):
+        """Return the DeepFace class, importing deepface on first call."""
+        if self.deepface_module is None:
+            with self.lock:
+                if self.deepface_module is None:
+                    from deepface import DeepFace
+                    self.deepface_module = DeepFace
+        return self.deepface_module
+
+    def recognizer(self, model_name="VGG-Face"):
+        """The recognition model; DeepFace caches it after the first build."""
+        return self.deepface().build_model(model_name)
+
+    def warm_up(self, model_name="VGG-Face", detector_backend="opencv"):
+        """Build both models and push one dummy input through each (once per model pair)."""
+        key = (model_name, detector_backend)
+        if key in self.warmed_up:
+            return
+        DeepFace = self.deepface()
+        start = time.monotonic()
+        self.recognizer(model_name)
+        DeepFace.extract_faces(np.zeros((480, 640, 3), dtype=np.uint8),
+                               detector_backend=detector_backend, enforce_detection=False)
+        DeepFace.represent(img_path=np.zeros((224, 224, 3), dtype=np.uint8), model_name=model_name,
+                           detector_backend="skip", enforce_detection=False)
+        self.warmed_up.add(key)
+        print(f"Models {model_name}/{detector_backend} warmed up in {time.monotonic() - start:.1f}s.")
+
+    def preload(self, db_path=None, model_name="VGG-Face", detector_backend="opencv", watch_interval=None):
+        """
+        Warm the models, load the shared gallery and start the shared inference service.
+        - With `watch_interval` (seconds), the gallery also polls db_path for enrolled photos.
+        """
+        from face_gallery import get_gallery
+        from inference_service import get_inference_service
+
+        try:
+            self.warm_up(model_name, detector_backend)
+            if db_path is not None:
+                gallery = get_gallery(db_path)
+                get_inference_service(gallery)
+                if watch_interval:
+                    gallery.watch(watch_interval)
+        except Exception as e:
+            print(f"Error preloading models: {e}")
+
+    def preload_async(self, **kwargs):
+        """Run preload() on a background thread so the web server can start serving at once."""
+        thread = threading.Thread(target=self.preload, kwargs=kwargs, daemon=True)
+        thread.start()
+        return thread
+
+
+models = ModelRegistry()
@@ -0,0 +1,75 @@
+import atexit
+import threading
+
+from pymongo import InsertOne, MongoClient, UpdateOne
+from pymongo.uri_parser import parse_uri
+
+from memory_mongo import MEMORY_SCHEME, InMemoryCollection, InMemoryMongoClient
+
+# Connection pool size per client; one pool is shared by every handler in the process
+DEFAULT_POOL_SIZE = 100
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def client_key(db_uri):
+    """
+    What identifies a connection pool: hosts, credentials and options, so spellings of the
+    same deployment (a trailing slash, reordered hosts or options) share one client.
+    """
+    if db_uri.startswith(MEMORY_SCHEME):
+        return (MEMORY_SCHEME,)
+    parsed = parse_uri(db_uri)
+    options = tuple(sorted((name.lower(), repr(value)) for name, value in parsed["options"].items()))
+    return (tuple(sorted(parsed["nodelist"])), parsed["username"], parsed["password"], options)
+
+
+def get_client(db_uri, max_pool_size=DEFAULT_POOL_SIZE):
+    """
+    Return the process-wide client for a URI, creating it on first use.
+    - memory:// returns the in-process stand-in (benchmarks, load tests).
+    """
+    key = client_key(db_uri)
+    with _clients_lock:
+        client = _clients.get(key)
+        if client is None:
+            if db_uri.startswith(MEMORY_SCHEME):
+                client = InMemoryMongoClient()
+            else:
+                client = MongoClient(db_uri, maxPoolSize=max_pool_size)
+            _clients[key] = client
+        return client
+
+
+def to_request(operation):
+    """The pymongo request for one ("insert", document) or ("update", filter, update, upsert) tuple."""
+    kind = operation[0]
+    if kind == "insert":
+        return InsertOne(operation[1])
+    if kind == "update":
+        _, filter, update, upsert = operation
+        return UpdateOne(filter, update, upsert=upsert)
+    raise TypeError(f"Unsupported bulk operation: {kind!r}")
+
+
+def bulk_write(collection, operations, ordered=False):
+    """
+    Apply write tuples (see to_request) to a collection in one bulk write.
+    - The in-memory stand-in takes the tuples as they are; pymongo gets InsertOne/UpdateOne requests.
+    """
+    if isinstance(collection, InMemoryCollection):
+        return collection.bulk_write(operations, ordered=ordered)
+    return collection.bulk_write([to_request(operation) for operation in operations], ordered=ordered)
+
+
+def close_clients():
+    """Close every shared client; registered to run at interpreter exit."""
+    with _clients_lock:
+        clients = list(_clients.values())
+        _clients.clear()
+    for client in clients:
+        client.close()
+
+
+atexit.register(close_clients)
@@ -0,0 +1,97 @@
+import cv2
+import numpy as np
+
+
+class MotionGate:
+    def __init__(self, width=160, threshold=25, min_area=0.002, learning_rate=0.05,
+                 padding=0.15, full_frame_area=0.5, refresh_interval=30):
+        """
+        Cheap motion pre-stage that decides whether, and where, a frame needs face detection.
+        - Frames are downscaled to `width` pixels, greyed and blurred, then compared with a
+          running-average background; pixels that differ by more than `threshold` are motion.
+        - Moving blobs smaller than `min_area` (fraction of the frame) are ignored as noise.
+        - Regions are padded by `padding` (fraction of their size) so a face that moved into
+          view is detected whole, and merged when they overlap.
+        - When the regions cover more than `full_frame_area` of the frame, the whole frame is
+          detected instead, since one pass is then cheaper than several.
+        - Every `refresh_interval` frames the whole frame is detected regardless, so faces that
+          stood still since the last detection are still picked up.
+        """
+        self.width = width
+        self.threshold = threshold
+        self.min_area = min_area
+        self.learning_rate = learning_rate
+        self.padding = padding
+        self.full_frame_area = full_frame_area
+        self.refresh_interval = refresh_interval
+
+        self.background = None
+        self.frames_since_refresh = 0
+        self.skipped = 0
+
+    def regions(self, frame):
+        """
+        Regions of `frame` to run detection on, as (x, y, w, h) boxes in frame coordinates.
+        Returns [] when nothing moved, or one box covering the whole frame.
+        """
+        height, width = frame.shape[:2]
+        full_frame = [(0, 0, width, height)]
+        scale = self.width / float(width)
+        small = cv2.resize(frame, (self.width, max(1, int(height * scale))), interpolation=cv2.INTER_AREA)
+        gray = cv2.GaussianBlur(cv2.cvtColor(small, cv2.COLOR_BGR2GRAY), (5, 5), 0).astype(np.float32)
+
+        if self.background is None or self.background.shape != gray.shape:
+            self.background = gray
+            self.frames_since_refresh = 0
+            return full_frame
+
+        mask = cv2.absdiff(gray, self.background) > self.threshold
+        cv2.accumulateWeighted(gray, self.background, self.learning_rate)
+
+        self.frames_since_refresh += 1
+        if self.frames_since_refresh >= self.refresh_interval:
+            self.frames_since_refresh = 0
+            return full_frame
+
+        mask = cv2.dilate(mask.astype(np.uint8) * 255, None, iterations=2)
+        contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+        min_pixels = self.min_area * mask.shape[0] * mask.shape[1]
+        boxes = [cv2.boundingRect(c) for c in contours if cv2.contourArea(c) >= min_pixels]
+        if not boxes:
+            self.skipped += 1
+            return []
+
+        boxes = merge_boxes([self._to_frame(box, scale, width, height) for box in boxes])
+        if sum(w * h for _, _, w, h in boxes) > self.full_frame_area * width * height:
+            return full_frame
+        return boxes
+
+    def _to_frame(self, box, scale, width, height):
+        """Scale a downscaled box back to frame coordinates, padded and clipped to the frame."""
+        x, y, w, h = (int(round(v / scale)) for v in box)
+        pad_x, pad_y = int(w * self.padding), int(h * self.padding)
+        x0, y0 = max(0, x - pad_x), max(0, y - pad_y)
+        x1, y1 = min(width, x + w + pad_x), min(height, y + h + pad_y)
+        return x0, y0, x1 - x0, y1 - y0
+
+
+def merge_boxes(boxes):
+    """Merge overlapping (x, y, w, h) boxes until none overlap."""
+    boxes = list(boxes)
+    merged = True
+    while merged:
+        merged = False
+        for i in range(len(boxes)):
+            for j in range(i + 1, len(boxes)):
+                ax, ay, aw, ah = boxes[i]
+                bx, by, bw, bh = boxes[j]
+                if ax < bx + bw and bx < ax + aw and ay < by + bh and by < ay + ah:
+                    x0, y0 = min(ax, bx), min(ay, by)
+                    x1, y1 = max(ax + aw, bx + bw), max(ay + ah, by + bh)
+                    boxes[i] = (x0, y0, x1 - x0, y1 - y0)
+                    del boxes[j]
+                    merged = True
+                    break
+            if merged:
+                break
+    return boxes
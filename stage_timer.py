@@ -0,0 +1,63 @@
+import threading
+import time
+from contextlib import contextmanager
+
+# Pipeline stages timed by the camera classes
+STAGES = ("capture", "motion", "detect", "recognize", "annotate", "encode", "persist")
+
+
+class NullStageTimer:
+    """Default timer: records nothing."""
+
+    @contextmanager
+    def time(self, stage):
+        yield
+
+    def observe(self, stage, seconds):
+        pass
+
+
+class StageRecorder(NullStageTimer):
+    def __init__(self):
+        """Keep every duration observed per stage, for offline summaries."""
+        self.lock = threading.Lock()
+        self.samples = {}
+
+    @contextmanager
+    def time(self, stage):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - start)
+
+    def observe(self, stage, seconds):
+        with self.lock:
+            self.samples.setdefault(stage, []).append(seconds)
+
+    def reset(self):
+        with self.lock:
+            self.samples.clear()
+
+    def summary(self):
+        """Per-stage count, mean, p50 and p99 in milliseconds."""
+        with self.lock:
+            samples = {stage: list(values) for stage, values in self.samples.items()}
+        return {stage: summarize(values) for stage, values in samples.items()}
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def summarize(seconds):
+    values = sorted(seconds)
+    return {
+        "count": len(values),
+        "mean_ms": round(1000 * sum(values) / len(values), 3) if values else 0.0,
+        "p50_ms": round(1000 * percentile(values, 0.50), 3),
+        "p99_ms": round(1000 * percentile(values, 0.99), 3),
+    }